@@ -0,0 +1,26 @@
+"""
+Mixture variational autoencoder for the one-dimensional MT inverse problem
+
+Submodules are imported on first access, so importing the package does
+not load TensorFlow.
+"""
+
+import importlib
+
+_modules = ['config','data','forward','stream','network','posterior','training','results','server','xla','bench','profiling','cli']
+_names = {'FP':'forward','FP_adjoint':'forward','FP_np':'data','generate_dataset':'data',
+          'training_set':'data','validation_set':'data','stream_dataset':'stream',
+          'MyBNN':'network','build_net':'network','mixture_posterior':'posterior',
+          'infer_stations':'posterior','map_find':'posterior','predictive_stats':'posterior',
+          'load_model':'training','train_trial':'training','run_sweep':'training',
+          'save_results':'results','load_results':'results'}
+
+def __getattr__(name):
+    if name in _modules:
+        return importlib.import_module('.'+name,__name__)
+    if name in _names:
+        return getattr(importlib.import_module('.'+_names[name],__name__),name)
+    raise AttributeError('module %r has no attribute %r' % (__name__,name))
+
+def __dir__():
+    return sorted(list(globals()) + _modules + list(_names))
@@ -0,0 +1,204 @@
+"""
+Benchmark suite of the hot paths
+
+Measures the forward problem against batch size, number of frequencies and
+number of layers, the ELBO training step against batch size and posterior
+samples, and dis_ret/map_ret/sig_return against the number of samples,
+with the peak memory of every case. Results are written to JSON and can be
+compared against a stored baseline. bench_freq compares the training curves
+of the frequency-subsampled likelihood against wall time.
+"""
+
+import os
+import json
+import resource
+import threading
+import platform
+from time import time, sleep
+import numpy as np
+from . import config
+
+class MemoryPeak:
+    # Peak resident memory above the level at entry, polled from /proc
+    def __init__(self, interval=.005):
+        self.interval = interval
+        self.page = os.sysconf('SC_PAGE_SIZE') if hasattr(os,'sysconf') else 4096
+
+    def rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1])*self.page
+        except OSError: # No /proc: process high-water mark
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+    def poll(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak,self.rss())
+            sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = self.rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.poll,daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak,self.rss())
+        self.mb = (self.peak - self.start)/2**20
+
+def measure(stage, params, f, reps): # Warm-up call, then median time of reps calls and peak memory
+    t0 = time()
+    f()
+    t_first = time() - t0
+    times = []
+    with MemoryPeak() as mem:
+        for _ in range(reps):
+            t0 = time()
+            f()
+            times.append(time() - t0)
+    row = {'stage':stage,'params':params,'first_s':t_first,'median_s':float(np.median(times)),
+           'min_s':float(np.min(times)),'peak_mb':mem.mb}
+    print(json.dumps(row))
+    return row
+
+def bench_forward(batches, freqs, layers, reps):
+    import tensorflow as tf
+    from .forward import FP
+    def solver(omega_):
+        w = tf.constant(omega_)
+        return lambda x1, x2: FP(x1,x2,w)
+    rows = []
+    cases = [(b,config.m,config.n) for b in batches] + [(batches[0],m_,config.n) for m_ in freqs] + \
+            [(batches[0],config.m,n_) for n_ in layers]
+    for b, m_, n_ in dict.fromkeys(cases):
+        f = solver(2*np.pi*10**np.linspace(-2,3,m_))
+        x1 = config.total_thick*tf.math.softmax(tf.random.uniform((b,n_),0.,1.))
+        x2 = tf.random.uniform((1,b,n_),*config.prior_bounds)
+        row = measure('FP',{'batch':b,'m':m_,'n':n_},lambda: f(x1,x2).numpy(),reps)
+        row['soundings_per_s'] = b/row['median_s']
+        rows.append(row)
+    return rows
+
+def bench_train_step(batch_sizes, sampls, Y, reps):
+    import tensorflow as tf
+    from tensorflow.keras.optimizers import Adam
+    from .network import MyBNN
+    rows = []
+    cases = [(b,1) for b in batch_sizes] + [(batch_sizes[0],s) for s in sampls]
+    for b, s in dict.fromkeys(cases):
+        model_ = MyBNN(config.Mixture,sampl_=s)
+        model_.compile(optimizer=Adam(learning_rate=config.l_r[0],epsilon=1e-16),loss=model_.MyELBO)
+        x = tf.constant(np.asarray(Y[:b]))
+        rows.append(measure('train_step',{'b_s':b,'sampl':s},lambda: model_.train_on_batch(x,x),reps))
+    return rows
+
+def bench_inference(sample_counts, Y, reps):
+    from .network import MyBNN
+    from .posterior import dis_ret, map_ret, sig_return, fun_return
+    model_ = MyBNN(config.Mixture)
+    x = np.asarray(Y[:1])
+    _, sig, lo = fun_return(model_,x)
+    rows = [measure('map_ret',{},lambda: map_ret(model_,x).numpy(),reps)]
+    for s in sample_counts:
+        rows.append(measure('dis_ret',{'samples':s},lambda: dis_ret(model_,x,s).numpy(),reps))
+        rows.append(measure('sig_return',{'samples':s},lambda: sig_return(x[:,:config.n],lo[:,0,:],sig[:,0,:],s),reps))
+    return rows
+
+def run_suite(quick=False, reps=None): # Return the results of every benchmark
+    from .data import validation_set
+    _, Y = validation_set()
+    reps = reps or (3 if quick else 10)
+    if quick:
+        rows = bench_forward([500,5000],[25,50],[3,5],reps) + bench_train_step([100,500],[1,4],Y,reps) + \
+               bench_inference([10**3,10**4],Y,reps)
+    else:
+        rows = bench_forward([1000,10000,40000],[25,50,100],[3,5,10,20],reps) + \
+               bench_train_step([100,500,2000],[1,4,16],Y,reps) + bench_inference([10**3,10**4,10**5],Y,reps)
+    import tensorflow as tf
+    return {'machine':{'platform':platform.platform(),'processor':platform.processor(),'cpus':os.cpu_count(),
+                       'python':platform.python_version(),'tensorflow':tf.__version__},
+            'config':{'xla':config.xla,'fp_dtype':config.fp_dtype,'quick':quick,'reps':reps},
+            'results':rows}
+
+def key(row):
+    return row['stage'] + json.dumps(row['params'],sort_keys=True)
+
+def compare(current, baseline, tolerance=.2): # Return the cases slower (or bigger) than the baseline by more than tolerance
+    base = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio = r['median_s']/b['median_s']
+        mem = r['peak_mb'] - b['peak_mb']
+        slow = ratio > 1 + tolerance
+        big = mem > tolerance*max(b['peak_mb'],1.)
+        print('%-10s %-40s time x%.2f, peak memory %+.1f MB%s' % (r['stage'],json.dumps(r['params']),ratio,mem,
+                                                                   '  REGRESSION' if slow or big else ''))
+        if slow or big:
+            regressions.append({'case':key(r),'time_ratio':ratio,'peak_mb_diff':mem})
+    return regressions
+
+def main(out='bench_results.json', baseline=None, tolerance=.2, quick=False): # Return the number of regressions
+    current = run_suite(quick)
+    with open(out,'w') as f:
+        json.dump(current,f,indent=1)
+    print('Benchmarks in',out)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(current,json.load(f),tolerance)
+        print('%d regressions against %s' % (len(regressions),baseline))
+        return len(regressions)
+    return 0
+
+# ---------------------------------------------------------------------------
+# Frequency-subsampled likelihood
+# Training curves (val_loss, always on all m frequencies, against wall time)
+# for every subset size, from the same initial weights and data
+
+def bench_freq(subsets=(None,25,10,5), epochs=20, anneal=5, samples=5000, samples_val=2000):
+    import tensorflow as tf
+    from tensorflow.keras.optimizers import Adam
+    from .network import MyBNN
+    from .training import FreqSchedule
+    from .data import training_set, validation_set
+    _, Y = training_set()
+    _, Y_val = validation_set()
+    Y, Y_val = np.asarray(Y[:samples]), np.asarray(Y_val[:samples_val])
+    class Curve(tf.keras.callbacks.Callback):
+        def on_train_begin(self, logs=None):
+            self.t0 = time()
+            self.rows = []
+        def on_epoch_end(self, epoch, logs=None):
+            self.rows.append({'epoch':epoch,'wall_s':time() - self.t0,'loss':float(logs['loss']),
+                              'val_loss':float(logs['val_loss'])})
+    saved = config.freq_subset, config.freq_anneal
+    runs = {}
+    try:
+        for k in subsets:
+            config.freq_subset, config.freq_anneal = k, (anneal if k else 0)
+            np.random.seed(42)
+            tf.random.set_seed(42)
+            model_ = MyBNN(config.Mixture)
+            model_.compile(optimizer=Adam(learning_rate=config.l_r[0],epsilon=1e-16),loss=model_.MyELBO)
+            curve = Curve()
+            callbacks = [FreqSchedule(epochs),curve] if k else [curve]
+            model_.fit(Y,Y,batch_size=config.b_s,epochs=epochs,validation_data=(Y_val,Y_val),callbacks=callbacks,verbose=0)
+            runs[k or config.m] = curve.rows
+    finally:
+        config.freq_subset, config.freq_anneal = saved
+    target = runs[config.m][-1]['val_loss'] if config.m in runs else None
+    rows = []
+    for k, curve in runs.items():
+        reached = [r['wall_s'] for r in curve if target is not None and r['val_loss'] <= target]
+        row = {'stage':'freq_subset','params':{'n_freq':k,'epochs':epochs,'anneal':anneal},
+               's_per_epoch':curve[-1]['wall_s']/len(curve),'final_val_loss':curve[-1]['val_loss'],
+               'time_to_full_val_loss_s':reached[0] if reached else None,'curve':curve}
+        print('Frequencies %3d: %.2f s/epoch, final val_loss %.4f, time to the full-set val_loss %s' %
+              (k,row['s_per_epoch'],row['final_val_loss'],'%.1fs' % reached[0] if reached else '-'))
+        rows.append(row)
+    return rows
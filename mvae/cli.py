@@ -0,0 +1,219 @@
+"""
+Command line entry points: generate, train, infer, serve and bench
+
+TensorFlow, TensorFlow Probability and matplotlib are only imported by the
+commands that need them.
+"""
+
+import os
+import argparse
+from time import time
+import numpy as np
+from . import config
+
+def set_seeds():
+    import tensorflow as tf
+    np.random.seed(42)
+    tf.random.set_seed(42)
+
+def trial_path(i):
+    return os.path.join(config.ckpt_dir,'trial_%d' % i)
+
+def generate(args): # Build (or reuse) the cached training and validation sets
+    from .data import training_set, validation_set
+    t0 = time()
+    _, Y_training = training_set()
+    _, Y_val = validation_set()
+    print('Training set %s, validation set %s (%.1fs)' % (Y_training.shape,Y_val.shape,time() - t0))
+
+def train(args): # Train every (epp, l_r) trial, or run the sweep
+    from .data import training_set, validation_set
+    from .training import train_trial, run_sweep
+    start_time = time() # Initial time
+    set_seeds()
+    if args.sweep:
+        run_sweep()
+        return
+    _, Y_training = training_set()
+    _, Y_val = validation_set()
+    history = {}
+    for i in range(len(config.epp)):
+        _, h = train_trial(trial_path(i),config.l_r[i],config.b_s,config.epp[i],Y_training,Y_val)
+        for k, v in h.items():
+            history.setdefault(k,[]).extend(v)
+    time_train = time() - start_time # 271 min
+    print('Time of Training:',time_train/60)
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.plot((np.asarray(history.get('loss',[])).reshape(-1)))
+        plt.plot((np.asarray(history.get('val_loss',[])).reshape(-1)))
+        plt.show()
+
+        plt.plot((np.asarray(history.get('MyMet',[])).reshape(-1)))
+        plt.plot((np.asarray(history.get('val_MyMet',[])).reshape(-1)))
+        plt.show()
+
+def infer(args): # Posterior of a batch of soundings with a trained model
+    from .training import load_model
+    from .posterior import infer_stations, infer_bench, export_results
+    from .results import save_results, save_results_text, ResultsWriter, load_results
+    from .profiling import stage, flush
+    set_seeds()
+    model, history = load_model(args.checkpoint or trial_path(len(config.epp)-1))
+    if args.input and not args.export:
+        Y = np.load(args.input,mmap_mode='r')
+    else:
+        from .data import validation_set
+        X, Y = validation_set()
+    if args.bench:
+        infer_bench(model,Y)
+        return
+    if config.profile_trace:
+        import tensorflow as tf
+        tf.profiler.experimental.start(os.path.join(config.profile_trace,'infer'))
+    t0 = time()
+    if args.export: # Estimation of the validation sounding config.val
+        results = export_results(model,X,Y,history,config.val)
+        with stage('export'):
+            path = save_results(args.output or config.results_file,results)
+    else: # Every chunk of stations goes to the store as it arrives
+        with ResultsWriter(args.output or config.results_file,Y.shape[0]) as writer:
+            for a, res in infer_stations(model,Y):
+                with stage('export'):
+                    writer.write(a,res)
+        path = writer.path
+    if args.text:
+        with stage('export'), load_results(path) as store:
+            for k in store.keys():
+                save_results_text('.',{k: store[k]})
+    print('Results in',path)
+    if config.profile_trace:
+        tf.profiler.experimental.stop()
+    flush('infer',wall_s=time() - t0,stations=1 if args.export else int(Y.shape[0]))
+
+def bench(args): # Benchmark suite and benchmarks of the forward problem, adjoint, inference, XLA, frequency subsets and results store
+    if 'forward' in args.what:
+        from .forward import FP_bench
+        FP_bench()
+    if 'adjoint' in args.what:
+        from .forward import FP_grad_check
+        FP_grad_check()
+    if 'infer' in args.what:
+        from .training import load_model
+        from .posterior import infer_bench
+        from .data import validation_set
+        model, _ = load_model(args.checkpoint or trial_path(len(config.epp)-1))
+        infer_bench(model,validation_set()[1])
+    if 'suite' in args.what:
+        from .bench import main as run_bench
+        if run_bench(args.out,args.baseline,args.tolerance,args.quick):
+            raise SystemExit(1)
+    if 'freq' in args.what:
+        import json
+        from .bench import bench_freq
+        path = os.path.splitext(args.out)[0] + '_freq.json'
+        with open(path,'w') as f:
+            json.dump({'results':bench_freq()},f,indent=1)
+        print('Benchmarks in',path)
+    if 'xla' in args.what:
+        from .xla import xla_bench
+        xla_bench()
+    if 'results' in args.what:
+        from .results import load_results, find_results, results_bench
+        with load_results(find_results(config.results_file)) as store:
+            results = {k: np.asarray(store[k][()]) for k in store.keys()}
+        results_bench(results)
+
+def serve(args): # Local inference server with micro-batching
+    from .training import load_model
+    from .server import serve as run_server
+    set_seeds()
+    model, _ = load_model(args.checkpoint or trial_path(len(config.epp)-1))
+    run_server(model,args.host,args.port,args.socket,args.max_batch,args.max_delay)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mvae',description=__doc__.splitlines()[1])
+    parser.add_argument('--samples',type=int,help='Samples of the training set')
+    parser.add_argument('--samples-val',type=int,help='Samples of the validation set')
+    parser.add_argument('--workers',type=int,help='Processes of the generator')
+    parser.add_argument('--cache-dir',help='Directory of the cached datasets')
+    parser.add_argument('--ckpt-dir',help='Directory of the checkpoints')
+    parser.add_argument('--xla',action='store_true',help='Compile the training step, FP and the inference with XLA')
+    parser.add_argument('--profile',action='store_true',help='Per-stage profiling of train and infer')
+    parser.add_argument('--profile-log',help='JSON lines log of the profiler')
+    parser.add_argument('--profile-trace',metavar='DIR',help='Directory of the TensorBoard profiler trace')
+    sub = parser.add_subparsers(dest='command',required=True)
+
+    p = sub.add_parser('generate',help=generate.__doc__)
+    p.set_defaults(func=generate)
+
+    p = sub.add_parser('train',help=train.__doc__)
+    p.add_argument('--epochs',type=int,nargs='+',help='Epochs of every trial')
+    p.add_argument('--lr',type=float,nargs='+',help='Learning rate of every trial')
+    p.add_argument('--batch-size',type=int)
+    p.add_argument('--mixture',type=int,help='Number of densities')
+    p.add_argument('--patience',type=int)
+    p.add_argument('--no-resume',action='store_true')
+    p.add_argument('--streaming',action='store_true',help='Train on the tf.data stream')
+    p.add_argument('--adjoint',action='store_true',help='Use the adjoint gradient of FP')
+    p.add_argument('--freq-subset',type=int,help='Frequencies of the likelihood per minibatch')
+    p.add_argument('--freq-anneal',type=int,help='Final epochs over which the subset grows back to all frequencies')
+    p.add_argument('--sweep',action='store_true',help='Run the hyperparameter sweep')
+    p.add_argument('--plot',action='store_true',help='Plot the loss and metric histories')
+    p.set_defaults(func=train)
+
+    p = sub.add_parser('infer',help=infer.__doc__)
+    p.add_argument('--checkpoint',help='Checkpoint directory of the trained model')
+    p.add_argument('--input',help='.npy with one sounding per row [thicknesses, log-apparent resistivities, phases]')
+    p.add_argument('--output',help='Path of the results store (without extension)')
+    p.add_argument('--samples-station',type=int,help='Posterior samples per station')
+    p.add_argument('--chunk',type=int,help='Stations per network call')
+    p.add_argument('--export',action='store_true',help='Estimation of the validation sounding --val')
+    p.add_argument('--val',type=int,help='Validation sounding of --export')
+    p.add_argument('--text',action='store_true',help='Also write every result to a text file')
+    p.add_argument('--bench',action='store_true',help='Only report stations/second')
+    p.set_defaults(func=infer)
+
+    p = sub.add_parser('bench',help=bench.__doc__)
+    p.add_argument('what',nargs='*',default=['forward','adjoint'],choices=['forward','adjoint','infer','results','xla','suite','freq'])
+    p.add_argument('--checkpoint',help='Checkpoint directory of the trained model')
+    p.add_argument('--out',default='bench_results.json',help='JSON results of the suite')
+    p.add_argument('--baseline',help='JSON results of a previous suite to compare against')
+    p.add_argument('--tolerance',type=float,default=.2,help='Relative slowdown reported as a regression')
+    p.add_argument('--quick',action='store_true',help='Smaller suite')
+    p.set_defaults(func=bench)
+
+    p = sub.add_parser('serve',help=serve.__doc__)
+    p.add_argument('--checkpoint',help='Checkpoint directory of the trained model')
+    p.add_argument('--host',default='127.0.0.1')
+    p.add_argument('--port',type=int,default=8000)
+    p.add_argument('--socket',help='Unix socket path (instead of host/port)')
+    p.add_argument('--max-batch',type=int,help='Soundings per micro-batch')
+    p.add_argument('--max-delay',type=float,help='Maximum wait of a request for its micro-batch (s)')
+    p.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    for name, key in [('samples','samples'),('samples_val','samples_val'),('workers','n_workers'),
+                      ('cache_dir','cache_dir'),('ckpt_dir','ckpt_dir'),('epochs','epp'),('lr','l_r'),
+                      ('batch_size','b_s'),('mixture','Mixture'),('patience','patience'),
+                      ('samples_station','infer_samples'),('chunk','infer_chunk'),('val','val'),
+                      ('freq_subset','freq_subset'),('freq_anneal','freq_anneal')]:
+        if getattr(args,name,None) is not None:
+            setattr(config,key,getattr(args,name))
+    if args.xla:
+        config.xla = True
+    if args.profile:
+        config.profile = True
+    if args.profile_log:
+        config.profile_log = args.profile_log
+    if args.profile_trace:
+        config.profile_trace = args.profile_trace
+    if getattr(args,'no_resume',False):
+        config.resume = False
+    if getattr(args,'streaming',False):
+        config.streaming = True
+    if getattr(args,'adjoint',False):
+        config.fp_adjoint = True
+    if len(config.l_r)<len(config.epp):
+        config.l_r = config.l_r + config.l_r[-1:]*(len(config.epp)-len(config.l_r))
+    args.func(args)
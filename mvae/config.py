@@ -0,0 +1,114 @@
+"""
+Parameters of the data, forward problem, network, training and inference.
+The modules read them at call time, so they can be changed before a run;
+the compiled functions (FP, map_find, ...) read them when they are traced.
+Derived settings (n, m, omega, inp, dim_out) are not recomputed and must be
+changed together with the settings they come from.
+"""
+
+import os
+import numpy as np
+
+# ---------------------------------------------------------------------------
+# Data
+
+mu = 4*np.pi*1E-7  # Magnetic Permeability (H/m)
+samples = 40000 # Samples for training set
+samples_val = 10000 # Samples for validation set
+thick_layer = 5 # Layers of subsurface
+prior_bounds = (0.1,4.) # Bounds of the log-resistivities
+total_thick = 2000 # Deep of subsurface layers (2000 m)
+n = thick_layer; # Dimension of the resistivities
+m = 50; # Number of frequencies
+np_fr = 10**np.linspace(-2,3,m) # Frequencies in [10**-2,10**3]
+frequencies = np_fr.tolist() # List of frequencies
+omega = 2*np.pi*np_fr # Angular frequencies
+porcentual_error = .03 # Standard deviation of error
+
+seed_training = 42 # Seed of the training set
+seed_val = 43 # Seed of the validation set
+chunk_size = 5000 # Soundings per chunk of the generator
+n_workers = os.cpu_count() # Processes of the generator
+cache_dir = 'data_cache' # Directory of the cached datasets
+
+# ---------------------------------------------------------------------------
+# Forward problem
+
+fp_dtype = 'complex64' # Complex dtype of the solver ('complex128' for double precision)
+fp_block = 256 # Soundings per block of FP for large batches (0: no blocks)
+fp_adjoint = False # Use FP_adjoint in the ELBO
+xla = False # Compile the training step, FP and the inference with XLA
+
+# ---------------------------------------------------------------------------
+# Streaming data
+
+streaming = False # Train on the tf.data stream instead of the training set
+stream_samples = None # Soundings per epoch (None: samples)
+stream_parallel = -1 # Parallel calls of the sampler (-1: tf.data.AUTOTUNE)
+stream_buffer = 4 # Prefetched batches
+
+# ---------------------------------------------------------------------------
+# Network
+
+inp = 2*m # Input dimension
+dim_out = n # Output dimension
+Mixture = 5 # Number of densities
+nodes_NN = [300,300] # Nodes and layers
+functions_NN = ['tanh','softplus','linear'] # Activations, the last one of the output layer
+
+# ---------------------------------------------------------------------------
+# Training
+
+epp = [1000] # Epochs
+l_r = [10**-5] # Learning rate
+b_s = 500 # Batch size
+ckpt_dir = 'checkpoints' # Directory of the checkpoints (one subdirectory per trial)
+ckpt_every = 10 # Epochs between periodic checkpoints
+patience = 100 # Epochs without improvement of val_loss before stopping (None: no early stopping)
+resume = True # Resume every trial from its last checkpoint
+freq_subset = None # Frequencies of the likelihood per minibatch (None: all m)
+freq_anneal = 0 # Final epochs over which the subset grows back to all m frequencies
+
+# ---------------------------------------------------------------------------
+# Hyperparameter sweep
+
+sweep_grid = {'l_r':[10**-5,10**-4],'b_s':[500],'Mixture':[5],'nodes_NN':[[300,300]]}
+sweep_epochs = 1000 # Maximum epochs of a trial
+sweep_rung = 100 # Epochs of the first rung
+sweep_eta = 2 # Reduction factor of successive halving (1: no pruning)
+sweep_workers = 4 # Processes of the pool
+sweep_threads = max(1,(os.cpu_count() or 1)//sweep_workers) # Threads per process
+sweep_dir = 'sweep' # Checkpoints and results of the sweep
+
+# ---------------------------------------------------------------------------
+# Inference
+
+sample_grap = 10**5 # Samples to generate the mixture estimation for the inverse problem
+val = 3500 # Sample of validation set
+infer_chunk = 1024 # Stations per network call
+infer_samples = 1000 # Posterior samples per station
+map_iters = 200 # Maximum iterations of the mode finder
+map_tol = 1e-6 # Tolerance of the mode finder
+pred_chunk = 10000 # Soundings (samples x stations) per chunk of the predictive statistics
+pred_block = 16 # Stations per block of the predictive statistics
+pred_threads = 4 # Threads of the predictive statistics
+pred_bins = 1000 # Histogram bins per output
+pred_quantiles = (.05,.5,.95) # Quantiles of the predictive distribution
+server_max_batch = 256 # Soundings per micro-batch of the server
+server_max_delay = .005 # Maximum wait of a request for its micro-batch (s)
+server_max_samples = 1000 # Maximum posterior samples per station of a request
+
+# ---------------------------------------------------------------------------
+# Results
+
+results_file = 'results_1d' # Path of the store (without extension)
+results_compress = False # Compress the store
+
+# ---------------------------------------------------------------------------
+# Profiling
+
+profile = False # Per-stage profiling of training and inference
+profile_log = 'profile.jsonl' # Structured log of the profiler (JSON lines)
+profile_trace = None # Directory of the TensorBoard profiler trace (None: no trace)
+profile_batches = (10,20) # Training steps of the TensorBoard trace
+profile_reps = 5 # Timed calls of every stage probe per epoch
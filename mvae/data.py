@@ -0,0 +1,95 @@
+"""
+Synthetic MT soundings
+
+Soundings are generated in chunks over a process pool and stored in
+memory-mapped .npy files, cached under a hash of the configuration.
+Rows of X: [log-resistivities, thicknesses], rows of Y: [thicknesses, log-apparent resistivities, phases]
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import multiprocessing
+import numpy as np
+from . import config
+
+def FP_np(x1,x2,omega_=None): # NumPy version of FP for the generator processes
+    mu = config.mu
+    omega = config.omega if omega_ is None else np.asarray(omega_)
+    h = np.asarray(x1,np.float64)[...,None]
+    rho = 10**np.asarray(x2,np.float64)[...,None]
+    k = (1+1j)*np.sqrt(omega*mu/(2*rho))
+    W = k*rho
+    E = np.exp(-2*k*h)
+    Z = W[...,-1,:]
+    for j in range(x2.shape[-1]-2,-1,-1):
+        re = E[...,j,:]*(W[...,j,:] - Z)/(W[...,j,:] + Z)
+        Z = W[...,j,:]*(1 - re)/(1 + re)
+    return np.concatenate([np.log10(np.abs(Z)**2/(mu*omega)),np.angle(Z)],-1).astype(np.float32)
+
+def gen_chunk(args): # Generate and write one chunk of soundings
+    spec, i, seed_seq, path = args
+    rng = np.random.default_rng(seed_seq)
+    a = i*spec['chunk']
+    size = min(spec['chunk'],spec['samples']-a)
+    resistivities = rng.uniform(*spec['prior_bounds'],(size,spec['thick_layer']))
+    t = np.exp(rng.uniform(0.,1.,(size,spec['thick_layer'])))
+    thicknesses = spec['total_thick']*t/np.sum(t,1,keepdims=True)
+    data = FP_np(thicknesses,resistivities[None],2*np.pi*np.asarray(spec['frequencies']))[0]
+    if spec['porcentual_error']>0:
+        data = rng.normal(data,np.abs(data)*spec['porcentual_error'])
+    X = np.lib.format.open_memmap(os.path.join(path,'X.npy'),mode='r+')
+    Y = np.lib.format.open_memmap(os.path.join(path,'Y.npy'),mode='r+')
+    X[a:a+size] = np.concatenate([resistivities,thicknesses],1)
+    Y[a:a+size] = np.concatenate([thicknesses,data],1)
+    X.flush()
+    Y.flush()
+    return i
+
+def dataset_spec(samples_,seed,error): # Return the settings of a dataset and their hash, its cache key
+    spec = {'seed':seed,'samples':samples_,'thick_layer':config.thick_layer,'frequencies':config.frequencies,
+            'porcentual_error':error,'prior_bounds':list(config.prior_bounds),'total_thick':config.total_thick,
+            'chunk':config.chunk_size}
+    return spec, hashlib.sha1(json.dumps(spec,sort_keys=True).encode()).hexdigest()[:16]
+
+def generate_dataset(samples_,seed,error): # Return the memory-mapped X, Y of a dataset
+    spec, key = dataset_spec(samples_,seed,error)
+    path = os.path.join(config.cache_dir,key)
+    if not os.path.exists(os.path.join(path,'config.json')):
+        tmp = path+'.tmp%d' % os.getpid()
+        os.makedirs(tmp)
+        np.lib.format.open_memmap(os.path.join(tmp,'X.npy'),mode='w+',dtype=np.float32,shape=(samples_,2*config.thick_layer))
+        np.lib.format.open_memmap(os.path.join(tmp,'Y.npy'),mode='w+',dtype=np.float32,shape=(samples_,config.thick_layer+2*len(config.frequencies)))
+        n_ch = -(-samples_//config.chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(n_ch)
+        args = [(spec,i,seeds[i],tmp) for i in range(n_ch)]
+        if config.n_workers>1 and n_ch>1:
+            # spawn: the parent may already run TensorFlow threads, the workers only need NumPy
+            with multiprocessing.get_context('spawn').Pool(min(config.n_workers,n_ch)) as pool:
+                for _ in pool.imap_unordered(gen_chunk,args):
+                    pass
+        else:
+            for a in args:
+                gen_chunk(a)
+        with open(os.path.join(tmp,'config.json'),'w') as f:
+            json.dump(spec,f)
+        try:
+            os.rename(tmp,path)
+        except OSError: # Generated by another run in the meantime
+            shutil.rmtree(tmp)
+    X = np.load(os.path.join(path,'X.npy'),mmap_mode='r')
+    Y = np.load(os.path.join(path,'Y.npy'),mmap_mode='r')
+    return X, Y
+
+def training_args():
+    return config.samples, config.seed_training, config.porcentual_error
+
+def validation_args():
+    return config.samples_val, config.seed_val, 0.
+
+def training_set(): # Training set with Gaussian noise
+    return generate_dataset(*training_args())
+
+def validation_set(): # Validation set
+    return generate_dataset(*validation_args())
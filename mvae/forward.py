@@ -0,0 +1,253 @@
+"""
+One-dimensional MT forward problem
+"""
+
+from time import time
+import numpy as np
+import tensorflow as tf
+from . import config
+from .xla import jit
+
+@tf.function
+def ten_log(x):
+    return tf.math.log(x)/tf.math.log(10.)
+
+# ---------------------------------------------------------------------------
+# One-dimensional MT Forward Problem (unrolled reference)
+
+@tf.function
+def FP_unrolled(x1,x2):
+    list_apres = []
+    list_phase = []    
+    thicknesses = x1#.numpy()
+    # thicknesses = 100*x[:,:,n:]#u_t*tf.math.softmax((x[:,:,n:]))#.numpy()
+    resistivities = 10**x2
+    for frequency in config.frequencies:   
+        w =  2*np.pi*frequency;       
+        impedancesR = list(range(config.n));
+        impedancesC = list(range(config.n));
+        #compute basement impedance
+        impedancesR[config.n-1] = tf.math.sqrt(w*config.mu*resistivities[:,:,config.n-1]/2);
+        impedancesC[config.n-1] = tf.math.sqrt(w*config.mu*resistivities[:,:,config.n-1]/2);
+        for j in range(config.n-2,-1,-1):
+            resistivity = tf.cast(resistivities[:,:,j],tf.float32);
+            thickness = tf.cast(thicknesses[:,j],tf.float32);
+            # 3. Compute apparent resistivity from top layer impedance
+            #Step 2. Iterate from bottom layer to top(not the basement) 
+            # Step 2.1 Calculate the intrinsic impedance of current layer
+            djR = tf.math.sqrt((w * config.mu * (1.0/resistivity))/2);
+            djC = tf.math.sqrt((w * config.mu * (1.0/resistivity))/2);
+            wjR = djR * resistivity;
+            wjC = djC * resistivity;
+            # Step 2.2 Calculate Exponential factor from intrinsic impedance
+            ejR = tf.math.exp(-2*thickness*djR)*tf.math.cos(-2*thickness*djC);   
+            ejC = -tf.math.exp(-2*thickness*djR)*tf.math.sin(2*thickness*djC); 
+            # Step 2.3 Calculate reflection coeficient using current layer
+            #          intrinsic impedance and the below layer impedance
+            belowImpedanceR = impedancesR[j + 1];
+            belowImpedanceC = impedancesC[j + 1];
+            rjR = (tf.math.square(wjR)+tf.math.square(wjC)-tf.math.square(belowImpedanceR)-tf.math.square(belowImpedanceC))/(tf.math.square(wjR+belowImpedanceR)+tf.math.square(wjC+belowImpedanceC));
+            rjC = (2*wjC*belowImpedanceR-2*wjR*belowImpedanceC)/(tf.math.square(wjR+belowImpedanceR)+tf.math.square(wjC+belowImpedanceC));
+            reR = rjR*ejR - rjC*ejC;
+            reC = rjR*ejC + rjC*ejR;
+            auxR = (1-tf.math.square(reR)-tf.math.square(reC))/(tf.math.square(1+reR)+tf.math.square(reC))# ((1 - re)/(1 + re)) R
+            auxC = -(2*reC)/(tf.math.square(1+reR)+tf.math.square(reC)) # ((1 - re)/(1 + re)) I
+            ZjR = wjR*auxR - wjC*auxC;
+            ZjC = wjR*auxC + wjC*auxR;
+            impedancesR[j] = ZjR;
+            impedancesC[j] = ZjC;
+        # Step 3. Compute apparent resistivity from top layer impedance
+        ZR = impedancesR[0];
+        ZC = impedancesC[0];
+        absZ = tf.math.sqrt(tf.math.square(ZR)+tf.math.square(ZC));
+        apparentResistivity = (absZ * absZ)/(config.mu * w);
+        phase = tf.math.atan2(ZC, ZR);
+        list_apres.append(apparentResistivity)
+        list_phase.append(phase)
+    aRes = ten_log(tf.convert_to_tensor(list_apres, dtype=tf.float32))
+    phas = tf.convert_to_tensor(list_phase, dtype=tf.float32)
+    formation = tf.reshape(tf.transpose(tf.concat([aRes,phas],0)),(x2.shape[0],x2.shape[1],2*config.m))
+    return formation
+
+# ---------------------------------------------------------------------------
+# One-dimensional MT Forward Problem (vectorized over frequencies)
+
+def fp_fields(x1,x2,omega_=None):
+    # x1: thicknesses (batch,n), x2: log-resistivities (sampl,batch,n)
+    # Frequencies are broadcast on the last axis -> (sampl,batch,n,m)
+    # omega_: angular frequencies (default: the m of config)
+    rdtype = tf.as_dtype(config.fp_dtype).real_dtype
+    w = tf.constant(config.omega,rdtype) if omega_ is None else tf.cast(omega_,rdtype)
+    h = tf.cast(x1,rdtype)[...,None]
+    resistivities = tf.cast(10**x2,rdtype)[...,None]
+    d = tf.math.sqrt(config.mu/(2*resistivities))*tf.math.sqrt(w) # Skin wavenumber of every layer
+    k = tf.complex(d,d) # (1+i)*d
+    W = tf.complex(d*resistivities,d*resistivities) # Intrinsic impedances
+    # Exponential factors exp(-2kh), in real arithmetic (complex exp is ~10x slower on CPU)
+    a = 2*d*h
+    ea = tf.math.exp(-a)
+    E = tf.complex(ea*tf.math.cos(a),-ea*tf.math.sin(a))
+    return w, tf.complex(h,tf.zeros_like(h)), k, W, E
+
+def fp_recursion(W,E,keep=False):
+    # Impedance recursion from the basement to the top layer
+    # keep=True returns the impedances of every layer in a TensorArray
+    n_l = W.shape[-2]
+    def layer(j,Z,*Zs):
+        if keep:
+            Zs = (Zs[0].write(j+1,Z),)
+        # Z_j = W_j(1 - re)/(1 + re), re = E_j(W_j - Z)/(W_j + Z), with one division
+        Wj = tf.gather(W,j,axis=-2)
+        A = Wj + Z
+        B = tf.gather(E,j,axis=-2)*(Wj - Z)
+        return (j - 1, Wj*(A - B)/(A + B)) + Zs
+    # The TensorArray is only carried with keep=True (an unused one does not
+    # compile with XLA); the static trip count lets the gradient compile too
+    Zs = (tf.TensorArray(W.dtype,size=n_l),) if keep else ()
+    _, Z, *Zs = tf.while_loop(lambda j,Z,*Zs: j >= 0, layer, (tf.constant(n_l-2), W[...,n_l-1,:]) + Zs,
+                              maximum_iterations=n_l-1)
+    if keep:
+        return Zs[0].write(0,Z)
+    return Z
+
+def fp_output(Z,w):
+    ZR = tf.math.real(Z)
+    ZC = tf.math.imag(Z)
+    aRes = tf.math.log((tf.math.square(ZR)+tf.math.square(ZC))/(config.mu*w))/np.log(10.)
+    phas = tf.math.atan2(ZC,ZR)
+    return tf.cast(tf.concat([aRes,phas],-1),tf.float32)
+
+def fp_solve(x1,x2,omega_=None):
+    w, _, _, W, E = fp_fields(x1,x2,omega_)
+    return fp_output(fp_recursion(W,E),w)
+
+def fp_blocks(x1,x2,omega_=None):
+    # fp_solve over blocks of fp_block soundings of the flattened (sampl,batch),
+    # so the (block,n,m) intermediates stay in cache for large batches
+    shape = tf.broadcast_dynamic_shape(tf.shape(x2),tf.concat([[1],tf.shape(x1)],0))
+    rows = shape[0]*shape[1]
+    bs = config.fp_block
+    nb = (rows + bs - 1)//bs
+    pad = [[0,nb*bs - rows],[0,0]]
+    n_l = x2.shape[-1]
+    x1_ = tf.reshape(tf.pad(tf.reshape(tf.broadcast_to(x1,shape),[rows,n_l]),pad),[nb,bs,n_l])
+    x2_ = tf.reshape(tf.pad(tf.reshape(tf.broadcast_to(x2,shape),[rows,n_l]),pad),[nb,1,bs,n_l])
+    y = tf.map_fn(lambda a: fp_solve(a[0],a[1],omega_)[0],(x1_,x2_),fn_output_signature=tf.float32,parallel_iterations=1)
+    return tf.reshape(tf.reshape(y,[nb*bs,-1])[:rows],tf.concat([shape[:2],[-1]],0))
+
+@tf.function
+def FP(x1,x2,omega_=None):
+    # Blocks only for a static number of soundings above fp_block (inference);
+    # the training batches have an unknown batch size and are solved at once
+    dims = [x2.shape[0],x2.shape[1],x1.shape[0]] # sampl, batch of x2 and of x1
+    if config.fp_block and None not in dims and dims[0]*max(dims[1:]) > config.fp_block:
+        return fp_blocks(x1,x2,omega_)
+    return fp_solve(x1,x2,omega_)
+
+FP_xla = jit(FP.python_function)
+
+def forward_fn(): # FP, compiled with XLA if config.xla
+    return FP_xla if config.xla else FP
+
+# ---------------------------------------------------------------------------
+# Adjoint gradient of the Forward Problem
+# Backward pass recomputes the recursion and only keeps one impedance per
+# layer, instead of every intermediate of the tape
+
+def unbroadcast(g,x):
+    # Sum the gradient g over the axes where x was broadcast
+    _, axes = tf.raw_ops.BroadcastGradientArgs(s0=tf.shape(g),s1=tf.shape(x))
+    return tf.cast(tf.reshape(tf.reduce_sum(g,axes),tf.shape(x)),x.dtype)
+
+def stack_layers(ta):
+    # TensorArray of (...,m) -> (...,n,m)
+    s = ta.stack()
+    r = len(s.shape)
+    return tf.transpose(s,list(range(1,r-1))+[0,r-1])
+
+@tf.custom_gradient
+def fp_adjoint_op(x1,x2,omega_):
+    def grad(dy):
+        w, h, k, W, E = fp_fields(x1,x2,omega_)
+        n_l = W.shape[-2]
+        Zs = fp_recursion(W,E,keep=True)
+        dy = tf.cast(dy,w.dtype)
+        m_ = tf.shape(w)[0]
+        # Adjoint of log10|Z|^2 and arg(Z) through log(Z)
+        Zb = tf.complex(dy[...,:m_]*2/np.log(10.),dy[...,m_:])*tf.math.conj(1/Zs.read(0))
+        Wb = tf.TensorArray(W.dtype,size=n_l)
+        Eb = tf.TensorArray(W.dtype,size=n_l)
+        def layer(j,Zb,Wb,Eb):
+            Wj = tf.gather(W,j,axis=-2)
+            Ej = tf.gather(E,j,axis=-2)
+            Zn = Zs.read(j+1)
+            r = (Wj - Zn)/(Wj + Zn)
+            re = Ej*r
+            dZ_re = -2*Wj/tf.math.square(1 + re)
+            dZ_W = (1 - re)/(1 + re) + dZ_re*Ej*2*Zn/tf.math.square(Wj + Zn)
+            dZ_Zn = -dZ_re*Ej*2*Wj/tf.math.square(Wj + Zn)
+            Wb = Wb.write(j,Zb*tf.math.conj(dZ_W))
+            Eb = Eb.write(j,Zb*tf.math.conj(dZ_re*r))
+            return j + 1, Zb*tf.math.conj(dZ_Zn), Wb, Eb
+        _, Zb, Wb, Eb = tf.while_loop(lambda j,Zb,Wb,Eb: j < n_l-1, layer, (tf.constant(0),Zb,Wb,Eb),
+                                      maximum_iterations=n_l-1)
+        Wb = stack_layers(Wb.write(n_l-1,Zb)) # Basement impedance is its intrinsic impedance
+        Eb = stack_layers(Eb.write(n_l-1,tf.zeros_like(Zb)))
+        # dW/dx = W ln(10)/2, dE/dx = h k E ln(10), dE/dh = -2 k E
+        dx2 = tf.math.real(Wb*tf.math.conj(W*np.log(10.)/2) + Eb*tf.math.conj(h*k*E*np.log(10.)))
+        dx1 = tf.math.real(Eb*tf.math.conj(-2*k*E))
+        return unbroadcast(tf.reduce_sum(dx1,-1),x1), unbroadcast(tf.reduce_sum(dx2,-1),x2), None
+    return FP(x1,x2,omega_), grad
+
+@tf.function
+def FP_adjoint(x1,x2,omega_=None):
+    return fp_adjoint_op(x1,x2,config.omega if omega_ is None else omega_)
+
+def FP_grad_check(b=64,sampl_=2):
+    # Relative error of the adjoint gradients against autodiff through FP
+    x1 = config.total_thick*tf.math.softmax(tf.random.uniform((b,config.n),0.,1.))
+    x2 = tf.random.uniform((sampl_,b,config.n),*config.prior_bounds)
+    v = tf.random.normal((sampl_,b,2*config.m))
+    grads = []
+    for f in [FP,FP_adjoint]:
+        with tf.GradientTape() as tape:
+            tape.watch([x1,x2])
+            y = tf.reduce_sum(v*f(x1,x2))
+        grads.append(tape.gradient(y,[x1,x2]))
+    for name, g, g_ in zip(['thicknesses','resistivities'],grads[0],grads[1]):
+        err = (tf.norm(g - g_)/tf.norm(g)).numpy()
+        print('FP_adjoint gradient w.r.t. %s: relative error %.2e' % (name,err))
+    return grads
+
+def FP_bench(batch_sizes=(500,40000),reps=5):
+    # Max deviation and time (forward and gradient) of FP against FP_unrolled
+    rows = []
+    for b in batch_sizes:
+        x1 = config.total_thick*tf.math.softmax(tf.random.uniform((b,config.n),0.,1.))
+        x2 = tf.random.uniform((1,b,config.n),*config.prior_bounds)
+        res = {}
+        for name, f in [('unrolled',FP_unrolled),('vectorized',FP)]:
+            @tf.function
+            def grad(x1,x2):
+                with tf.GradientTape() as tape:
+                    tape.watch(x2)
+                    y = tf.reduce_sum(f(x1,x2))
+                return tape.gradient(y,x2)
+            t0 = time()
+            y = f(x1,x2) # Includes tracing
+            t_trace = time() - t0
+            t0 = time()
+            for _ in range(reps):
+                y = f(x1,x2)
+            t_fwd = (time() - t0)/reps
+            grad(x1,x2)
+            t0 = time()
+            for _ in range(reps):
+                grad(x1,x2).numpy()
+            res[name] = (y,t_trace,t_fwd,(time() - t0)/reps)
+        err = tf.reduce_max(tf.math.abs(res['vectorized'][0] - res['unrolled'][0])).numpy()
+        (_, tr0, f0, g0), (_, tr1, f1, g1) = res['unrolled'], res['vectorized']
+        print('FP batch %d: max |diff| %.2e, trace %.1fs -> %.1fs, forward %.3fs -> %.3fs (%.1fx), gradient %.3fs -> %.3fs (%.1fx)'
+              % (b,err,tr0,tr1,f0,f1,f0/f1,g0,g1,g0/g1))
+        rows.append({'batch':b,'max_diff':float(err),'forward_speedup':f0/f1,'gradient_speedup':g0/g1})
+    return rows
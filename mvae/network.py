@@ -0,0 +1,90 @@
+"""
+Network of the mixture parameters and the variational autoencoder
+"""
+
+import tensorflow as tf
+import tensorflow_probability as tfp
+tfd = tfp.distributions
+from tensorflow.keras.layers import Dense, Reshape
+from tensorflow.keras.models import Sequential
+from . import config
+from .forward import FP, FP_adjoint
+from .posterior import mixture_params, mixture_dist
+
+# ---------------------------------------------------------------------------
+# equential model construction
+
+def build_net(nodes,mixture,functions=None): # Network of the mixture parameters
+    functions = functions or config.functions_NN
+    nodes = list(nodes) + [mixture*(2*config.dim_out + 1)]
+    net = Sequential()
+    for i in range(len(nodes)):
+        if i==0:
+            net.add(Dense(nodes[i], input_shape=(config.inp,), activation=functions[i],use_bias=False,name="Input_layer"))
+        elif i==(len(nodes)-1):
+            net.add(Dense(nodes[i], activation=functions[-1],use_bias=True,name="Ouput_layer"))
+        else:
+            net.add(Dense(nodes[i], activation=functions[min(i,len(functions)-2)],use_bias=False,name='Hidden_layer_'+str(i)))
+    net.add(Reshape((mixture,2*config.dim_out + 1),input_shape=(nodes[-1],)))
+    return net
+
+def net_spec(net): # Mixture, nodes_NN and functions_NN of a network of build_net
+    dense = [l for l in net.layers if isinstance(l,Dense)]
+    return {'Mixture':net.layers[-1].target_shape[0],'nodes_NN':[l.units for l in dense[:-1]],
+            'functions_NN':[tf.keras.activations.serialize(l.activation) for l in dense]}
+
+# ---------------------------------------------------------------------------
+###### Autoencoder
+# ---------------------------------------------------------------------------
+
+class MyBNN(tf.keras.Model):
+    def __init__(self, Mixture, sampl_=1, name=None, net=None):
+        super(MyBNN, self).__init__()
+        self.loc_net = build_net(config.nodes_NN,Mixture) if net is None else net
+        self.sampl = sampl_
+        self.var_lik = tf.Variable(0.,name='std',trainable=False)
+        self.cold = tf.Variable(0.,name='cold',trainable=False)
+        self.rng = tf.random.Generator.from_seed(42) # Sampling seeds, saved in the checkpoints
+        self.n_freq = tf.Variable(config.m,name='n_freq',trainable=False) # Frequencies of the likelihood (config.freq_subset)
+    
+    def call(self, x):
+        return self.loc_net(x[:,config.n:])
+
+# ELBO loss funtion (abs)
+    def MyELBO(self,x,s):
+        # Name scopes group the ops of every stage in the profiler trace
+        with tf.name_scope('mixture'):
+            pro, sig, loc_preds = mixture_params(s)
+            q = mixture_dist(pro,sig,loc_preds,.1,3.9)
+            q_ = mixture_dist(pro,sig,loc_preds,.0,4.)
+        with tf.name_scope('sampling'):
+            self.samples_q = q.sample(self.sampl,seed=tf.cast(self.rng.make_seeds(1)[:,0],tf.int32)) # Samples of Mixture
+        #-- Prior distribution of x
+        p = tfd.Uniform(0., 4.)
+       
+        # FP inlined in the step: the gradient of the nested tf.function is
+        # recompiled by XLA on every call
+        fp = FP_adjoint if config.fp_adjoint else FP.python_function
+        with tf.name_scope('FP'):
+            if config.freq_subset:
+                # Random subset of n_freq frequencies per minibatch. The mean over a
+                # uniform subset is an unbiased estimate of the mean over all of them
+                # (the m/n_freq rescaling of the sum cancels with the normalisation)
+                idx = tf.argsort(self.rng.uniform((config.m,)))[:self.n_freq]
+                cols = tf.concat([idx,idx + config.m],0)
+                self.y_obs = tf.gather(x[:,config.n:],cols,axis=1)
+                self.FP_pred = fp(x[:,:config.n],self.samples_q,tf.gather(tf.constant(config.omega),idx))
+            else:
+                self.y_obs = x[:,config.n:]
+                self.FP_pred = fp(x[:,:config.n],self.samples_q) # y prediction
+        with tf.name_scope('log_prob'):
+            likelihood = tfd.Normal(0., tf.math.abs(0.03*self.FP_pred))
+            log_like =  - (tf.reduce_mean(likelihood.log_prob(self.FP_pred-self.y_obs))) + tf.reduce_mean(q_.log_prob(self.samples_q)) - (tf.reduce_mean(p.log_prob(self.samples_q))) 
+        return (log_like)
+
+# log-likelihood loss funtion
+    def MyMet(self,x,s):
+        # On the frequencies of the ELBO step: the subset of config.freq_subset in training
+        likelihood = tfd.Normal(0.,tf.math.abs(self.y_obs)*config.porcentual_error)
+        log_like = - tf.reduce_mean(likelihood.log_prob(self.FP_pred-self.y_obs))
+        return log_like
@@ -0,0 +1,277 @@
+"""
+Mixture posterior of the network output: construction, samples, MAP,
+batched inference over stations and predictive statistics
+"""
+
+from time import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tensorflow as tf
+import tensorflow_probability as tfp
+tfd = tfp.distributions
+from . import config
+from .forward import FP, forward_fn
+from .xla import jit
+from .profiling import stage
+
+def fun_part_uni(xx):
+    x = (xx)**2
+    return x/tf.math.reduce_sum(x,1,keepdims=True)
+
+# Mixture head: the network output s (batch,Mixture,2*dim_out+1) holds the
+# locations, scales and weights of every component, the posterior is a
+# MixtureSameFamily over one batched TruncatedNormal
+
+def mixture_params(s): # Return the mixture parameters from the network output
+    d = (s.shape[-1] - 1)//2
+    pro = fun_part_uni(s[:,:,2*d])
+    sig = tf.math.softplus(s[:,:,d:2*d])
+    loc_preds = 4*tf.math.sigmoid(tf.cast(s[:,:,:d],dtype=tf.float32))
+    return pro, sig, loc_preds
+
+def mixture_dist(pro,sig,loc_preds,low=.1,high=4.): # Return the mixture distribution
+    return tfd.MixtureSameFamily(mixture_distribution=tfd.Categorical(probs=pro),
+                                 components_distribution=tfd.Independent(tfd.TruncatedNormal(loc_preds,sig,low,high),
+                                                                         reinterpreted_batch_ndims=1))
+
+def mixture_posterior(s,low=.1,high=4.): # Return the mixture posterior and its parameters
+    pro, sig, loc_preds = mixture_params(s)
+    return mixture_dist(pro,sig,loc_preds,low,high), pro, sig, loc_preds
+
+def fun_return(model,x): # Return the mixture parameters
+    _, pro, sig, loc_preds = mixture_posterior(model(x))
+    return pro, sig, loc_preds
+
+def dis_ret(model,x,sample_): # Return the mixture samples
+    q, _, _, _ = mixture_posterior(model(x))
+    samples_q = tf.cast(q.sample(sample_),tf.float32)
+    return samples_q
+
+@tf.function
+def map_find(pro,sig,loc_preds,low=.1,high=4.): # Return the mode of the mixture of every station
+    # Fixed-point (EM / mean-shift) iteration for the modes of a mixture with
+    # diagonal components, projected on [low,high], started from every
+    # component location. The best of the Mixture local modes is returned.
+    u = tfd.TruncatedNormal(loc_preds,sig,low,high)
+    prec = 1/tf.math.square(sig)
+    log_pro = tf.math.log(pro)
+    def log_comp(x): # x: (starts,b,n) -> (starts,b,Mixture)
+        return tf.reduce_sum(u.log_prob(x[:,:,None,:]),-1) + log_pro
+    def body(i,x,d):
+        r = tf.math.softmax(log_comp(x),-1)[...,None]
+        x_new = tf.clip_by_value(tf.reduce_sum(r*prec*loc_preds,-2)/tf.reduce_sum(r*prec,-2),low,high)
+        return i + 1, x_new, tf.reduce_max(tf.math.abs(x_new - x))
+    x0 = tf.clip_by_value(tf.transpose(loc_preds,[1,0,2]),low,high)
+    _, x, _ = tf.while_loop(lambda i,x,d: (i < config.map_iters) & (d > config.map_tol), body,
+                            (tf.constant(0),x0,tf.constant(np.inf,tf.float32)))
+    best = tf.math.argmax(tf.reduce_logsumexp(log_comp(x),-1),0)
+    return tf.gather(tf.transpose(x,[1,0,2]),best,batch_dims=1)
+
+def map_ret(model,x): # Return the MAP of the mixture
+    _, pro, sig, loc_preds = mixture_posterior(model(x))
+    return map_find(pro,sig,loc_preds)
+
+# ---------------------------------------------------------------------------
+# Batched inference over stations
+
+def station_summaries(s,sample_): # Posterior summaries of the network output of a batch of stations
+    q, pro, sig, loc_preds = mixture_posterior(s)
+    u = tfd.TruncatedNormal(loc_preds,sig,.1,4.)
+    m1 = u.mean()
+    m2 = u.variance() + tf.math.square(m1)
+    mean = tf.reduce_sum(pro[...,None]*m1,1)
+    std = tf.math.sqrt(tf.math.maximum(tf.reduce_sum(pro[...,None]*m2,1) - tf.math.square(mean),0.))
+    res = {'pro':pro,'sig':sig,'loc':loc_preds,'mean':mean,'std':std,'map':map_find(pro,sig,loc_preds)}
+    if sample_>0:
+        res['samples'] = tf.transpose(q.sample(sample_),[1,0,2])
+    return res
+
+summaries_xla = jit(station_summaries)
+
+def infer_stations(model,x,sample_=None,chunk=None):
+    # Yields (first station, results) for every chunk of stations, results
+    # holds the mixture parameters (pro, sig, loc), the posterior mean, std
+    # and MAP, and the posterior samples (stations, sample_, n) if sample_ > 0
+    sample_ = config.infer_samples if sample_ is None else sample_
+    chunk = chunk or config.infer_chunk
+    summaries = summaries_xla if config.xla else station_summaries
+    for a in range(0,x.shape[0],chunk):
+        with stage('network'):
+            s = model(x[a:a+chunk])
+        with stage('summaries'):
+            res = {k: v.numpy() for k, v in summaries(s,sample_).items()}
+        yield a, res
+
+def infer_bench(model,x,sample_=None,chunk=None): # Stations per second of infer_stations
+    sample_ = config.infer_samples if sample_ is None else sample_
+    chunk = chunk or config.infer_chunk
+    t0 = time()
+    for _ in infer_stations(model,x,sample_,chunk):
+        pass
+    rate = x.shape[0]/(time() - t0)
+    print('Inference: %d stations, %d samples, chunk %d: %.1f stations/s' % (x.shape[0],sample_,chunk,rate))
+    return rate
+
+# ---------------------------------------------------------------------------
+# Streaming predictive statistics
+# FP of the posterior samples is computed in chunks of about pred_chunk
+# soundings, at most pred_threads chunks at a time, the mean/variance are
+# merged Welford-style and the quantiles come from a fixed-bin count
+# histogram whose range is set by the first chunk. Stations are processed
+# in blocks of pred_block, so memory does not grow with the stations
+
+def chunk_stats(xx,q,size,lo=None,hi=None,histogram=True): # Moments and histogram of one chunk
+    y = tf.cast(forward_fn()(xx,q.sample(size)),tf.float64)
+    mean = tf.reduce_mean(y,0)
+    M2 = tf.reduce_sum(tf.math.square(y - mean),0)
+    if not histogram:
+        return size, mean.numpy(), M2.numpy(), None, None, None
+    if lo is None: # Histogram range: first chunk range with a 50% margin
+        y_min = tf.reduce_min(y,0)
+        y_max = tf.reduce_max(y,0)
+        pad = .5*(y_max - y_min) + 1e-6
+        lo, hi = y_min - pad, y_max + pad
+    idx = tf.clip_by_value(tf.cast(tf.math.floor((y - lo)/(hi - lo)*config.pred_bins),tf.int32),0,config.pred_bins-1)
+    cols = tf.size(mean)
+    idx = tf.reshape(idx,(size,cols)) + tf.range(cols)*config.pred_bins
+    hist = tf.math.bincount(tf.reshape(idx,[-1]),minlength=cols*config.pred_bins,maxlength=cols*config.pred_bins)
+    hist = tf.reshape(hist,tf.concat([tf.shape(mean),[config.pred_bins]],0))
+    return size, mean.numpy(), M2.numpy(), hist.numpy().astype(np.int64), lo, hi
+
+def hist_quantiles(hist,lo,hi,quantiles): # Quantiles from the histograms, linear inside each bin
+    c = np.cumsum(hist,-1)
+    width = (hi - lo)/config.pred_bins
+    res = []
+    for qq in quantiles:
+        t = qq*c[...,-1:]
+        k = np.minimum(np.sum(c < t,-1,keepdims=True),config.pred_bins-1)
+        h_k = np.take_along_axis(hist,k,-1)
+        frac = (t - np.take_along_axis(c,k,-1) + h_k)/np.maximum(h_k,1)
+        res.append(lo + (k[...,0] + frac[...,0])*width)
+    return np.stack(res)
+
+def merge_stats(a,b): # Merge the (count, mean, M2, hist) of two chunks
+    count, mean, M2, hist = a
+    count_b, mean_b, M2_b, hist_b = b
+    delta = mean_b - mean
+    total = count + count_b
+    mean = mean + delta*count_b/total
+    M2 = M2 + M2_b + np.square(delta)*count*count_b/total
+    return total, mean, M2, None if hist is None else hist + hist_b
+
+def block_stats(xx,q,sam,chunk,quantiles,histogram,pool): # predictive_stats of one block of stations
+    size = max(1,chunk//xx.shape[0]) # Samples per chunk
+    sizes = [min(size,sam-a) for a in range(0,sam,size)]
+    *stats, lo, hi = chunk_stats(xx,q,sizes[0],histogram=histogram)
+    pending = deque() # At most pred_threads chunks in flight
+    for size in sizes[1:]:
+        if len(pending)>=config.pred_threads:
+            stats = merge_stats(stats,pending.popleft().result()[:4])
+        pending.append(pool.submit(chunk_stats,xx,q,size,lo,hi,histogram))
+    while pending:
+        stats = merge_stats(stats,pending.popleft().result()[:4])
+    count, mean, M2, hist = stats
+    res = {'mean':mean.astype(np.float32),'std':np.sqrt(M2/count).astype(np.float32)}
+    if histogram:
+        res['quantiles'] = hist_quantiles(hist,lo.numpy(),hi.numpy(),quantiles).astype(np.float32)
+    return res
+
+def predictive_stats(xx,q,sam,chunk=None,quantiles=None,histogram=True,block=None):
+    # Return mean, std (stations,2m) and, with histogram, quantiles
+    # (len(quantiles),stations,2m) of FP(xx,q.sample(sam)); q has one batch
+    # member per station
+    chunk = chunk or config.pred_chunk
+    quantiles = quantiles or config.pred_quantiles
+    block = block or config.pred_block
+    res = []
+    with ThreadPoolExecutor(config.pred_threads) as pool:
+        for a in range(0,xx.shape[0],block):
+            res.append(block_stats(xx[a:a+block],q[a:a+block],sam,chunk,quantiles,histogram,pool))
+    return {k: np.concatenate([r[k] for r in res],-2) for k in res[0]}
+
+def predictive_return(xx,mu,sigma,sam,histogram=True): # Return predictive_stats of FP over the posterior samples
+    q = tfd.Independent(tfd.TruncatedNormal(mu[:,:],sigma[:,:],.1,4.), reinterpreted_batch_ndims=1)
+    return predictive_stats(xx,q,sam,histogram=histogram)
+
+def sig_return(xx,mu,sigma,sam): # Return the std of FP over the posterior samples
+    return predictive_return(xx,mu,sigma,sam,histogram=False)['std']
+
+# ---------------------------------------------------------------------------
+# Estimation of a validation sounding
+
+def export_results(model,X_val,Y_val,history,val): # Return the results of the validation sounding val
+    sample_grap = config.sample_grap
+    Y_val_ = Y_val[val:val+1,:]
+    with stage('sampling'):
+        pl = dis_ret(model,Y_val_,sample_grap).numpy()
+    with stage('map'):
+        map_rr = map_ret(model,Y_val_).numpy()
+    map_r = np.reshape(map_rr,(map_rr.shape[0],1,config.n))
+    map_r_sig = tf.math.reduce_std(pl,0)
+    plo = tf.reduce_mean(pl,0)
+    with stage('mixture'):
+        p, sig, lo = (v.numpy() for v in fun_return(model,Y_val_))
+    mup = lo
+
+    aRes_tr = Y_val_[0:1,config.n:config.m+config.n]
+    phas_tr = (180/np.pi)*Y_val_[0:1,config.m+config.n:]  
+
+    with stage('FP'):
+        aRes_MAP = FP(Y_val_[:,:config.n],map_r)[:,:,:config.m].numpy()
+        phas_MAP = (180/np.pi)*FP(Y_val_[:,:config.n],map_r)[:,:,config.m:].numpy()
+    with stage('predictive'):
+        pred_MAP = predictive_return(Y_val_[:,:config.n],map_rr,map_r_sig,sample_grap)
+    sig_aRes_MAP = pred_MAP['std'][:,:config.m]
+    sig_phas_MAP = (180/np.pi)*pred_MAP['std'][:,config.m:]
+
+
+    resis_es = pl.reshape((sample_grap,config.n))
+    thick_es = tf.repeat(Y_val_[:,:config.n],sample_grap,axis=0)
+    with stage('FP'):
+        aRes_es = FP(Y_val_[:,:config.n],pl)[:,:,:config.m].numpy()
+        phas_es = (180/np.pi)*FP(Y_val_[:,:config.n],pl)[:,:,config.m:].numpy()
+
+    # Return Values
+
+    results = {'aRes_training_1d':aRes_tr,
+               'phas_training_1d':phas_tr,
+               'aRes_Estimation_1d':aRes_es,
+               'phas_Estimation_1d':phas_es,
+               'resistivity_training_1d':X_val[val:val+1,:config.n],
+               'thicknesses_training_1d':X_val[val:val+1,config.n:],
+               'resistivity_Estimation_1d':resis_es,
+               'thicknesses_Estimation_1d':thick_es,
+               'loss_tr':history.get('loss',[]),
+               'loss_va':history.get('val_loss',[]),
+               'metrics_tr':history.get('MyMet',[]),
+               'metrics_val':history.get('val_MyMet',[]),
+               'resistivity_training_MAP':map_r,
+               'thicknesses_training_MAP':Y_val_[:,:config.n],
+               'pred_quantiles':np.asarray(config.pred_quantiles)}
+
+    for k in range(lo.shape[1]): # Estimation of every component
+        M = 'M%d' % (k+1)
+        with stage('FP'):
+            FP_M = FP(Y_val_[:,:config.n],mup[:,k:k+1,:]).numpy()
+        with stage('predictive'):
+            pred_M = predictive_return(Y_val_[:,:config.n],lo[:,k,:],sig[:,k,:],sample_grap)
+        sig_M = pred_M['std']
+        results['resistivity_training_'+M] = mup[:,k:k+1,:]
+        results['thicknesses_training_'+M] = Y_val_[:,:config.n]
+        results['aRes_'+M] = FP_M[:,:,:config.m]
+        results['phas_'+M] = (180/np.pi)*FP_M[:,:,config.m:]
+        results['sig_sig_'+M] = sig[:,k:k+1,:]
+        results['sig_aRes_'+M] = sig_M[:,:config.m]
+        results['sig_phas_'+M] = (180/np.pi)*sig_M[:,config.m:]
+        results['band_aRes_'+M] = pred_M['quantiles'][...,:config.m] # (len(pred_quantiles),1,m)
+        results['band_phas_'+M] = (180/np.pi)*pred_M['quantiles'][...,config.m:]
+
+    results.update({'aRes_MAP':aRes_MAP,
+                    'phas_MAP':phas_MAP,
+                    'sig_aRes_MAP':sig_aRes_MAP,
+                    'sig_phas_MAP':sig_phas_MAP,
+                    'band_aRes_MAP':pred_MAP['quantiles'][...,:config.m],
+                    'band_phas_MAP':(180/np.pi)*pred_MAP['quantiles'][...,config.m:],
+                    'prob':p})
+    return results
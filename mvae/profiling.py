@@ -0,0 +1,152 @@
+"""
+Per-stage profiling of training and inference (config.profile)
+
+StageProfiler is a Keras callback that logs, for every epoch, the wall time
+of the training steps, input waits and validation, the time and op count of
+the ELBO stages (network, mixture sampling, mixture log_prob, FP and its
+gradient) run on a probe batch, the tracing counts of the compiled functions
+and the memory high-water mark. stage() times the stages of the inference
+and export. Records are JSON lines in config.profile_log; config.profile_trace
+also writes a TensorBoard profiler trace.
+"""
+
+import os
+import json
+from time import time
+from contextlib import contextmanager
+import numpy as np
+import tensorflow as tf
+from . import config
+from .bench import MemoryPeak
+
+_stages = {} # Stage name -> [calls, seconds] since the last flush
+
+def write_log(event, **record): # Append one record to the structured log
+    record = dict(event=event,time=time(),pid=os.getpid(),**record)
+    with open(config.profile_log,'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+@contextmanager
+def stage(name): # Wall time of a stage, also a TensorBoard trace event
+    if not config.profile:
+        yield
+        return
+    t0 = time()
+    with tf.profiler.experimental.Trace(name):
+        yield
+    s = _stages.setdefault(name,[0,0.])
+    s[0] += 1
+    s[1] += time() - t0
+
+def flush(event, **record): # Log the stages timed since the last flush
+    stages = {k: {'calls':c,'s':s} for k, (c, s) in _stages.items()}
+    _stages.clear()
+    if config.profile:
+        write_log(event,stages=stages,**record)
+    return stages
+
+def op_count(f, *args): # Nodes of the graph of the tf.function f, including the called functions
+    g = f.get_concrete_function(*args).graph.as_graph_def()
+    return len(g.node) + sum(len(fn.node_def) for fn in g.library.function)
+
+def tracing_count(f):
+    count = getattr(f,'experimental_get_tracing_count',None)
+    return count() if count else 0
+
+def gpu_peaks(reset=False): # Peak memory (MB) of every GPU
+    peaks = {}
+    for i, _ in enumerate(tf.config.list_logical_devices('GPU')):
+        try:
+            if reset:
+                tf.config.experimental.reset_memory_stats('GPU:%d' % i)
+            else:
+                peaks['GPU:%d' % i] = tf.config.experimental.get_memory_info('GPU:%d' % i)['peak']/2**20
+        except (ValueError,AttributeError): # Not supported by this TensorFlow
+            pass
+    return peaks
+
+class StageProfiler(tf.keras.callbacks.Callback):
+    # x: probe batch of the stage timings, name: trial in the log
+    def __init__(self, x, name=''):
+        super(StageProfiler, self).__init__()
+        self.x = tf.constant(np.asarray(x))
+        self.name = name
+        self.traced = {}
+
+    def build_probes(self):
+        from .forward import FP, FP_adjoint
+        from .posterior import mixture_params, mixture_dist
+        model_ = self.model
+        fp = FP_adjoint if config.fp_adjoint else FP
+        seed = tf.constant([0,0]) # Own seed, the sampling generator of the model is not advanced
+        def mixture(s):
+            pro, sig, loc_preds = mixture_params(s)
+            return mixture_dist(pro,sig,loc_preds,.1,3.9), mixture_dist(pro,sig,loc_preds,.0,4.)
+        def fp_grad(x1,z):
+            with tf.GradientTape() as tape:
+                tape.watch(z)
+                y = fp(x1,z)
+            return tape.gradient(y,z)
+        self.probes = {'network': tf.function(lambda x: model_(x)),
+                       'sampling': tf.function(lambda s: mixture(s)[0].sample(model_.sampl,seed=seed)),
+                       'mixture_log_prob': tf.function(lambda s, z: mixture(s)[1].log_prob(z)),
+                       'FP': tf.function(lambda x1, z: fp(x1,z)),
+                       'FP_grad': tf.function(fp_grad)}
+        self.fp = fp
+        s = model_(self.x)
+        z = self.probes['sampling'](s)
+        x1 = self.x[:,:config.n]
+        self.args = {'network':(self.x,),'sampling':(s,),'mixture_log_prob':(s,z),'FP':(x1,z),'FP_grad':(x1,z)}
+        self.ops = {k: op_count(f,*self.args[k]) for k, f in self.probes.items()}
+
+    def functions(self): # Compiled functions whose retracing is logged
+        return {'train_function':self.model.train_function,'test_function':self.model.test_function,
+                'FP':self.fp}
+
+    def on_train_begin(self, logs=None):
+        self.build_probes()
+        write_log('train_begin',trial=self.name,ops=self.ops,batch=int(self.x.shape[0]))
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.t_epoch = time()
+        self.steps = []
+        self.t_end = None
+        self.wait = 0.
+        self.t_val = 0.
+        gpu_peaks(reset=True)
+        self.mem = MemoryPeak().__enter__()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.t_begin = time()
+        if self.t_end is not None: # Time between steps: input pipeline and callbacks
+            self.wait += self.t_begin - self.t_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.t_end = time()
+        self.steps.append(self.t_end - self.t_begin)
+
+    def on_test_begin(self, logs=None):
+        self.t_test = time()
+
+    def on_test_end(self, logs=None):
+        self.t_val += time() - self.t_test
+
+    def on_epoch_end(self, epoch, logs=None):
+        wall = time() - self.t_epoch
+        self.mem.__exit__(None,None,None)
+        stages = {}
+        for k, f in self.probes.items():
+            times = []
+            for _ in range(config.profile_reps):
+                t0 = time()
+                np.asarray(f(*self.args[k]))
+                times.append(time() - t0)
+            stages[k] = {'s':float(np.median(times)),'ops':self.ops[k]}
+        counts = {k: tracing_count(f) for k, f in self.functions().items()}
+        retraces = {k: v - self.traced.get(k,0) for k, v in counts.items() if v != self.traced.get(k,0)}
+        self.traced = counts
+        write_log('epoch',trial=self.name,epoch=epoch,wall_s=wall,steps=len(self.steps),
+                  step_s=float(np.median(self.steps)) if self.steps else None,step_total_s=float(np.sum(self.steps)),
+                  input_wait_s=self.wait,validation_s=self.t_val,stages=stages,tracing_counts=counts,
+                  retraces=retraces,peak_mb=self.mem.mb,gpu_peak_mb=gpu_peaks(),
+                  logs={k: float(v) for k, v in (logs or {}).items()})
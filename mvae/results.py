@@ -0,0 +1,145 @@
+"""
+Results store
+
+Every result is a dataset of one HDF5 file (chunked, optionally gzip
+compressed, read lazily by slices). Without h5py the store is a directory
+with one uncompressed .npy file per result, memory-mapped on reading.
+"""
+
+import os
+import shutil
+import tempfile
+from time import time
+import numpy as np
+try:
+    import h5py
+except ImportError: # Results are written to a directory of .npy files
+    h5py = None
+from . import config
+
+def save_results(path,results,compress=None): # Return the path of the store
+    compress = config.results_compress if compress is None else compress
+    arrays = {k: np.asarray(v,np.float32) for k, v in results.items()}
+    if h5py is not None:
+        path += '.h5'
+        with h5py.File(path,'w') as f:
+            for k, v in arrays.items():
+                opts = {'chunks':True,'compression':'gzip' if compress else None} if v.ndim and v.size else {}
+                f.create_dataset(k,data=v,**opts)
+    else:
+        os.makedirs(path,exist_ok=True)
+        for k, v in arrays.items():
+            np.save(os.path.join(path,k+'.npy'),v)
+    return path
+
+class ResultsWriter:
+    # Store of rows results written chunk by chunk: write(start,chunk) puts
+    # every result of chunk in rows [start:start+len] of a preallocated
+    # dataset (HDF5, or a memory-mapped .npy without h5py)
+    def __init__(self, path, rows, compress=None):
+        self.compress = config.results_compress if compress is None else compress
+        self.rows = rows
+        self.arrays = {}
+        if h5py is not None:
+            self.path = path + '.h5'
+            self.file = h5py.File(self.path,'w')
+        else:
+            self.path = path
+            self.file = None
+            os.makedirs(path,exist_ok=True)
+
+    def write(self, start, chunk):
+        for k, v in chunk.items():
+            v = np.asarray(v,np.float32)
+            if k not in self.arrays:
+                shape = (self.rows,) + v.shape[1:]
+                if self.file is not None:
+                    self.arrays[k] = self.file.create_dataset(k,shape,np.float32,chunks=True,
+                                                              compression='gzip' if self.compress else None)
+                else:
+                    self.arrays[k] = np.lib.format.open_memmap(os.path.join(self.path,k+'.npy'),mode='w+',
+                                                               dtype=np.float32,shape=shape)
+            self.arrays[k][start:start+len(v)] = v
+
+    def close(self): # Return the path of the store
+        if self.file is not None:
+            self.file.close()
+        else:
+            for v in self.arrays.values():
+                v.flush()
+        self.arrays = {}
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class NpyStore:
+    # Directory of .npy files with the interface of a read-only h5py.File
+    def __init__(self, path):
+        self.path = path
+
+    def keys(self):
+        return sorted(f[:-4] for f in os.listdir(self.path) if f.endswith('.npy'))
+
+    def __contains__(self, k):
+        return os.path.exists(os.path.join(self.path,k+'.npy'))
+
+    def __getitem__(self, k):
+        if k not in self:
+            raise KeyError(k)
+        return np.load(os.path.join(self.path,k+'.npy'),mmap_mode='r')
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def find_results(path): # Return the store written by save_results(path)
+    if os.path.exists(path+'.h5'):
+        return path+'.h5'
+    return path
+
+def load_results(path): # Lazy access to the store, results[name][slice]
+    if path.endswith('.h5'):
+        if h5py is None:
+            raise ImportError('h5py is required to read %s' % path)
+        return h5py.File(path,'r')
+    return NpyStore(path)
+
+def save_results_text(path,results): # One text file per result
+    for k, v in results.items():
+        np.savetxt(os.path.join(path,k),np.asarray(v).reshape(-1),fmt='%.7f')
+
+def results_bench(results): # Write/read time and size of the store and of the text files
+    tmp = tempfile.mkdtemp()
+    try:
+        modes = [('text',None),('store',False)] + ([('store (compressed)',True)] if h5py is not None else [])
+        for name, compress in modes:
+            path = os.path.join(tmp,name.replace(' ','_'))
+            os.makedirs(path)
+            t0 = time()
+            if compress is None:
+                save_results_text(path,results)
+            else:
+                save_results(os.path.join(path,'results'),results,compress)
+            t_write = time() - t0
+            t0 = time()
+            if compress is None:
+                for k in results:
+                    np.loadtxt(os.path.join(path,k))
+            else:
+                with load_results(find_results(os.path.join(path,'results'))) as store:
+                    for k in results:
+                        np.array(store[k]) # Forces the read of a memmap too
+            t_read = time() - t0
+            size = sum(os.path.getsize(os.path.join(d,f)) for d, _, files in os.walk(path) for f in files)
+            print('Results %s: write %.2fs, read %.2fs, %.1f MB' % (name,t_write,t_read,size/2**20))
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,169 @@
+"""
+Local inference server
+
+Loads a trained model once and answers HTTP requests over TCP or a Unix
+socket. Concurrent requests are merged into micro-batches: the first
+request of a batch waits at most server_max_delay seconds for others, up to
+server_max_batch soundings, and the batch goes through a single network
+call and mixture sampling. Batches are padded and the samples rounded up to
+powers of two, so the compiled summaries are traced once per bucket and not
+once per request; the samples of a request are clamped to server_max_samples.
+
+  POST /infer   {"soundings": [[...], ...], "samples": 0} -> mean, std, map, pro, sig, loc (and samples)
+  GET  /metrics p50/p99 latency, throughput and batch sizes
+  GET  /health
+"""
+
+import os
+import json
+import queue
+import socketserver
+import threading
+import collections
+from time import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from . import config
+from .posterior import infer_stations
+
+def bucket(k, top): # Smallest power of two >= k, at most top
+    return min(1 << max(k-1,0).bit_length(),top)
+
+class MicroBatcher:
+    def __init__(self, model, max_batch=None, max_delay=None):
+        self.model = model
+        self.max_batch = max_batch or config.server_max_batch
+        self.max_delay = config.server_max_delay if max_delay is None else max_delay
+        self.queue = queue.Queue()
+        self.latency = collections.deque(maxlen=10000) # Latencies of the last requests (s)
+        self.lock = threading.Lock()
+        self.start = time()
+        self.requests = 0
+        self.stations = 0
+        self.batches = 0
+        threading.Thread(target=self.run,daemon=True).start()
+
+    def submit(self, x, samples=0): # Return the results of the soundings x (blocks until served)
+        fut = Future()
+        samples = min(max(int(samples),0),config.server_max_samples)
+        self.queue.put((np.asarray(x,np.float32),samples,fut,time()))
+        return fut.result()
+
+    def run(self):
+        while True:
+            reqs = [self.queue.get()]
+            size = len(reqs[0][0])
+            deadline = reqs[0][3] + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    break
+                try:
+                    reqs.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                size += len(reqs[-1][0])
+            self.process(reqs)
+
+    def process(self, reqs): # One network call for all the requests of the batch
+        x = np.concatenate([r[0] for r in reqs],0)
+        samples = max(r[1] for r in reqs)
+        samples = bucket(samples,config.server_max_samples) if samples>0 else 0
+        # Padded to a bucket, or to a multiple of max_batch for larger batches
+        size = bucket(len(x),self.max_batch)
+        size = -(-len(x)//size)*size
+        try:
+            res = [r for _, r in infer_stations(self.model,np.pad(x,((0,size-len(x)),(0,0)),'edge'),samples,
+                                                min(size,self.max_batch))]
+            res = {k: np.concatenate([r[k] for r in res],0) for k in res[0]}
+        except Exception as e:
+            for r in reqs:
+                r[2].set_exception(e)
+            return
+        a = 0
+        now = time()
+        for x_r, samples_r, fut, t0 in reqs:
+            out = {k: v[a:a+len(x_r)] for k, v in res.items() if k != 'samples'}
+            if samples_r>0:
+                out['samples'] = res['samples'][a:a+len(x_r),:samples_r]
+            a += len(x_r)
+            fut.set_result(out)
+            self.latency.append(now - t0)
+        with self.lock:
+            self.requests += len(reqs)
+            self.stations += len(x)
+            self.batches += 1
+
+    def metrics(self):
+        lat = np.asarray(self.latency)
+        with self.lock:
+            elapsed = time() - self.start
+            return {'requests':self.requests,'stations':self.stations,'batches':self.batches,
+                    'mean_batch':self.stations/max(self.batches,1),
+                    'stations_per_s':self.stations/elapsed,'requests_per_s':self.requests/elapsed,
+                    'latency_p50_ms':float(np.percentile(lat,50))*1e3 if lat.size else None,
+                    'latency_p99_ms':float(np.percentile(lat,99))*1e3 if lat.size else None}
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, code, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(code)
+            self.send_header('Content-Type','application/json')
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self.send_json(200,batcher.metrics())
+            elif self.path == '/health':
+                self.send_json(200,{'status':'ok'})
+            else:
+                self.send_json(404,{'error':'not found'})
+
+        def do_POST(self):
+            if self.path != '/infer':
+                return self.send_json(404,{'error':'not found'})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get('Content-Length',0))))
+                x = np.asarray(req['soundings'],np.float32)
+                x = x[None] if x.ndim == 1 else x
+                if x.ndim != 2 or x.shape[1] != config.n+2*config.m:
+                    raise ValueError('soundings must have %d values (thicknesses, log-apparent resistivities, phases)'
+                                     % (config.n+2*config.m))
+                samples = int(req.get('samples',0))
+            except (ValueError,KeyError,TypeError) as e:
+                return self.send_json(400,{'error':str(e)})
+            try:
+                res = batcher.submit(x,samples)
+            except Exception as e: # Error of the batch (model, XLA, ...)
+                return self.send_json(500,{'error':str(e)})
+            self.send_json(200,{k: v.tolist() for k, v in res.items()})
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('local',0)
+
+def serve(model, host='127.0.0.1', port=8000, socket_path=None, max_batch=None, max_delay=None):
+    batcher = MicroBatcher(model,max_batch,max_delay)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path,make_handler(batcher))
+        print('Serving on',socket_path)
+    else:
+        server = ThreadingHTTPServer((host,port),make_handler(batcher))
+        print('Serving on http://%s:%d' % (host,port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
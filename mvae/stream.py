@@ -0,0 +1,27 @@
+"""
+Streaming training data
+
+New soundings are sampled from the prior every batch, so every epoch sees
+fresh data and the training set is never resident
+"""
+
+import tensorflow as tf
+from . import config
+from .forward import FP
+
+def sample_soundings(b,seed): # Batch of noisy soundings from the prior
+    n = config.n
+    seeds = tf.random.experimental.stateless_split(seed,3)
+    resistivities = tf.random.stateless_uniform((1,b,n),seeds[0],*config.prior_bounds)
+    thicknesses = config.total_thick*tf.math.softmax(tf.random.stateless_uniform((b,n),seeds[1],0.,1.))
+    data = FP(thicknesses,resistivities)[0]
+    data = data + tf.math.abs(data)*config.porcentual_error*tf.random.stateless_normal(tf.shape(data),seeds[2])
+    y = tf.concat([thicknesses,data],1)
+    return y, y
+
+def stream_dataset(b,steps,ep_0=0,epochs=1):
+    # steps batches for each of the epochs ep_0..epochs-1, seeded by the
+    # batch number, so a resumed run sees the same soundings
+    return tf.data.Dataset.range(ep_0*steps,epochs*steps).map(
+        lambda i: sample_soundings(b,tf.stack([tf.constant(config.seed_training,tf.int64),i])),
+        num_parallel_calls=config.stream_parallel).prefetch(config.stream_buffer)
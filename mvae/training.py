@@ -0,0 +1,237 @@
+"""
+Training of MyBNN: checkpoints, resume, early stopping and hyperparameter sweep
+"""
+
+import os
+import math
+import json
+import itertools
+import inspect
+import csv
+import hashlib
+import multiprocessing
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+from . import config
+from .data import training_set, validation_set, dataset_spec, training_args, validation_args
+from .network import MyBNN, build_net, net_spec
+from .xla import train_step_compiles
+from .profiling import StageProfiler
+
+# ---------------------------------------------------------------------------
+# Checkpoints and early stopping
+
+class TrainState(tf.keras.callbacks.Callback):
+    # Saves the weights, optimizer state, sampling generator, epoch and history
+    # every ckpt_every epochs ('last') and on every improvement of val_loss
+    # ('best'), and stops after patience epochs without improvement. The
+    # shuffle of every epoch is seeded by the epoch (shuffled_batches), so a
+    # resumed run sees the same batches. The state also records the network
+    # (load_model) and the key of the settings, and a checkpoint trained with
+    # other settings is not resumed
+    def __init__(self, net, path, key=None):
+        super(TrainState, self).__init__()
+        self.path = path
+        self.key = key
+        self.epoch = tf.Variable(0,trainable=False,dtype=tf.int64)
+        self.ckpt = tf.train.Checkpoint(model=net,optimizer=net.optimizer,epoch=self.epoch)
+        self.last = tf.train.CheckpointManager(self.ckpt,os.path.join(path,'last'),max_to_keep=1)
+        self.best = tf.train.CheckpointManager(self.ckpt,os.path.join(path,'best'),max_to_keep=1)
+        self.state = {'history':{},'best':math.inf,'best_epoch':-1,'wait':0,'model':net_spec(net.loc_net),'key':key}
+
+    def save(self, manager):
+        manager.save(checkpoint_number=int(self.epoch.numpy()))
+        with open(os.path.join(manager.directory,'state.json'),'w') as f:
+            json.dump(self.state,f)
+
+    def restore(self): # Return the epoch to resume from
+        if self.last.latest_checkpoint is None:
+            return 0
+        with open(os.path.join(self.last.directory,'state.json')) as f:
+            state = json.load(f)
+        if state.get('key') != self.key:
+            raise ValueError('%s was trained with other settings: train without resuming (--no-resume) or in another --ckpt-dir' % self.path)
+        self.ckpt.restore(self.last.latest_checkpoint)
+        self.state = state
+        ep_0 = int(self.epoch.numpy())
+        # 'last' can be up to ckpt_every-1 epochs older than 'best'
+        best_state = os.path.join(self.best.directory,'state.json')
+        if os.path.exists(best_state):
+            with open(best_state) as f:
+                best = json.load(f)
+            self.state['best'] = best['best']
+            self.state['best_epoch'] = best['best_epoch']
+            self.state['wait'] = max(0,ep_0 - 1 - best['best_epoch'])
+        return ep_0
+
+    def on_epoch_end(self, epoch, logs=None):
+        for k, v in (logs or {}).items():
+            self.state['history'].setdefault(k,[]).append(float(v))
+        self.epoch.assign(epoch+1)
+        val_loss = (logs or {}).get('val_loss',math.nan)
+        if not math.isnan(val_loss) and val_loss < self.state['best']:
+            self.state['best'] = val_loss
+            self.state['best_epoch'] = epoch
+            self.state['wait'] = 0
+            self.save(self.best)
+        else:
+            self.state['wait'] += 1
+        if config.patience is not None and self.state['wait'] >= config.patience:
+            self.model.stop_training = True
+        if (epoch+1) % config.ckpt_every == 0 or self.model.stop_training:
+            self.save(self.last)
+
+    def on_train_end(self, logs=None):
+        self.save(self.last)
+
+class FreqSchedule(tf.keras.callbacks.Callback):
+    # Frequencies of the likelihood (config.freq_subset): freq_subset up to the
+    # last freq_anneal epochs, then linear growth to all m at the last epoch.
+    # Validation always uses all m, so val_loss is the full ELBO. MyMet during
+    # training is on the frequencies of the subset, val_MyMet on all m
+    def __init__(self, epochs):
+        super(FreqSchedule, self).__init__()
+        self.epochs = epochs
+
+    def n_freq(self, epoch):
+        start = self.epochs - config.freq_anneal
+        if epoch < start:
+            return min(config.freq_subset,config.m)
+        return min(config.m,round(config.freq_subset + (config.m - config.freq_subset)*(epoch - start + 1)/config.freq_anneal))
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.k = self.n_freq(epoch)
+        self.model.n_freq.assign(self.k)
+
+    def on_test_begin(self, logs=None):
+        self.model.n_freq.assign(config.m)
+
+    def on_test_end(self, logs=None):
+        self.model.n_freq.assign(self.k)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs['n_freq'] = self.k
+
+    def on_train_end(self, logs=None):
+        self.model.n_freq.assign(config.m)
+
+def load_model(path): # Return the best trained MyBNN of a checkpoint directory and its full history
+    state = os.path.join(path,'last','state.json')
+    with open(state if os.path.exists(state) else os.path.join(path,'best','state.json')) as f:
+        state = json.load(f)
+    spec = state['model'] # Network of the checkpoint, not of the current config
+    net = MyBNN(spec['Mixture'],net=build_net(spec['nodes_NN'],spec['Mixture'],spec['functions_NN']))
+    net(tf.zeros((1,config.n+2*config.m)))
+    tf.train.Checkpoint(model=net).restore(tf.train.latest_checkpoint(os.path.join(path,'best'))).expect_partial()
+    return net, state['history']
+
+def shuffled_batches(Y,b_s_,ep_0,epochs):
+    # Batches of Y for the epochs ep_0..epochs-1, every epoch in a permutation
+    # seeded by its number, so the order does not depend on where a run resumed
+    Y = tf.constant(np.asarray(Y))
+    rows = Y.shape[0]
+    def epoch(e):
+        perm = tf.argsort(tf.random.stateless_uniform([rows],tf.stack([tf.constant(config.seed_training,tf.int64),e])))
+        return tf.data.Dataset.from_tensor_slices(perm).batch(b_s_)
+    batches = tf.data.Dataset.range(ep_0,epochs).flat_map(epoch)
+    return batches.map(lambda i: (tf.gather(Y,i),tf.gather(Y,i))).prefetch(2), -(-rows//b_s_)
+
+def train_trial(path,l_r_,b_s_,epochs,Y_training,Y_val,net=None,resume_=None,horizon=None):
+    # Train (or resume) one MyBNN with checkpoints in path, return it and its history
+    # horizon: final epochs of the training, the end of the frequency annealing (default: epochs)
+    model_ = MyBNN(config.Mixture,net=net)
+    # The frequency subset has a data-dependent size, which XLA does not compile
+    jit_compile = config.xla and not config.freq_subset and train_step_compiles(model_,Y_val[:b_s_])
+    model_.compile(optimizer=Adam(learning_rate=l_r_,epsilon=1e-16),loss=model_.MyELBO,metrics=[model_.MyMet,model_.MyELBO],
+                   jit_compile=jit_compile)
+    # Settings of the checkpoint, it is only resumed with the same ones
+    train_state = TrainState(model_,path,trial_key(dict(net_spec(model_.loc_net),l_r=l_r_,b_s=b_s_)))
+    ep_0 = train_state.restore() if (config.resume if resume_ is None else resume_) else 0
+    callbacks = [train_state]
+    if config.freq_subset:
+        callbacks.insert(0,FreqSchedule(horizon or epochs))
+    if config.profile:
+        callbacks.append(StageProfiler(Y_val[:b_s_],path))
+    if config.profile_trace:
+        callbacks.append(tf.keras.callbacks.TensorBoard(os.path.join(config.profile_trace,os.path.basename(path)),
+                                                        histogram_freq=0,write_graph=False,profile_batch=config.profile_batches))
+    if config.streaming:
+        from .stream import stream_dataset
+        steps = (config.stream_samples or config.samples)//b_s_
+        model_.fit(stream_dataset(b_s_,steps,ep_0,epochs),epochs=epochs,initial_epoch=ep_0,steps_per_epoch=steps,
+                   validation_data=(Y_val,Y_val),callbacks=callbacks,verbose=1)
+    else:
+        batches, steps = shuffled_batches(Y_training,b_s_,ep_0,epochs)
+        model_.fit(batches,epochs=epochs,initial_epoch=ep_0,steps_per_epoch=steps,
+                   validation_data=(Y_val,Y_val),callbacks=callbacks,verbose=1)
+    return model_, train_state.state['history']
+
+# ---------------------------------------------------------------------------
+# Hyperparameter sweep
+# Every configuration of sweep_grid is a trial trained in a process of a
+# spawn pool, with sweep_threads TensorFlow threads per process. With
+# successive halving the trials run sweep_rung epochs, the best 1/sweep_eta
+# by val_loss resume from their checkpoints for sweep_eta times more epochs,
+# and so on up to sweep_epochs. The results go to sweep_dir/results.csv.
+# Every trial directory is named by a hash of its settings and datasets, so
+# a re-run only resumes trials with the same configuration.
+
+def config_state(): # Picklable copy of the settings for the worker processes
+    return {k: v for k, v in vars(config).items() if not k.startswith('_') and not inspect.ismodule(v)}
+
+def trial_key(trial): # Directory name of a trial
+    spec = {'trial':trial,'data':[dataset_spec(*training_args())[1],dataset_spec(*validation_args())[1]],
+            'config':{k: getattr(config,k) for k in ['functions_NN','streaming','stream_samples','fp_dtype','fp_adjoint',
+                                                     'freq_subset','freq_anneal','patience']}}
+    return 'trial_' + hashlib.sha1(json.dumps(spec,sort_keys=True).encode()).hexdigest()[:12]
+
+def sweep_trial(args): # Train one trial up to epochs, return its best val_loss
+    key, trial, epochs, settings = args
+    vars(config).update(settings)
+    _, Y_training = training_set()
+    _, Y_val = validation_set()
+    net = build_net(trial['nodes_NN'],trial['Mixture'])
+    _, history = train_trial(os.path.join(config.sweep_dir,key),trial['l_r'],trial['b_s'],epochs,Y_training,Y_val,net,resume_=True,
+                             horizon=config.sweep_epochs) # Annealing at the end of the last rung
+    val_loss = [v for v in history.get('val_loss',[]) if not math.isnan(v)]
+    return key, min(val_loss) if val_loss else math.inf, len(history.get('loss',[]))
+
+def run_sweep(grid=None): # Return the table of results of every trial
+    grid = grid or config.sweep_grid
+    trials = {trial_key(t): t for t in (dict(zip(grid,v)) for v in itertools.product(*grid.values()))}
+    alive = list(trials)
+    # Datasets generated once here, the workers (daemonic, no pool of their own) only read the cache
+    training_set()
+    validation_set()
+    settings = dict(config_state(),n_workers=1)
+    table = {}
+    epochs = config.sweep_rung if config.sweep_eta>1 else config.sweep_epochs
+    env = {k: os.environ.get(k) for k in ['TF_NUM_INTRAOP_THREADS','TF_NUM_INTEROP_THREADS','OMP_NUM_THREADS']}
+    os.environ.update({'TF_NUM_INTRAOP_THREADS':str(config.sweep_threads),'TF_NUM_INTEROP_THREADS':'1',
+                       'OMP_NUM_THREADS':str(config.sweep_threads)})
+    try:
+        # A new process per trial so that every trial starts with a clean TensorFlow state
+        with multiprocessing.get_context('spawn').Pool(min(config.sweep_workers,len(trials)),maxtasksperchild=1) as pool:
+            while True:
+                for key, val_loss, ep_done in pool.imap_unordered(sweep_trial,[(k,trials[k],epochs,settings) for k in alive]):
+                    table[key] = dict(trials[key],val_loss=val_loss,epochs=ep_done)
+                    print('Sweep %s: %s' % (key,table[key]))
+                if epochs>=config.sweep_epochs:
+                    break
+                alive = sorted(alive,key=lambda k: table[k]['val_loss'])[:max(1,len(alive)//config.sweep_eta)]
+                epochs = min(epochs*config.sweep_eta,config.sweep_epochs)
+    finally:
+        for k, v in env.items():
+            if v is None:
+                os.environ.pop(k,None)
+            else:
+                os.environ[k] = v
+    os.makedirs(config.sweep_dir,exist_ok=True)
+    with open(os.path.join(config.sweep_dir,'results.csv'),'w',newline='') as f:
+        writer = csv.DictWriter(f,fieldnames=['trial']+list(grid)+['val_loss','epochs'])
+        writer.writeheader()
+        for key in sorted(table,key=lambda k: table[k]['val_loss']):
+            writer.writerow(dict(table[key],trial=key))
+    return table
@@ -0,0 +1,87 @@
+"""
+Opt-in XLA compilation (config.xla)
+
+jit compiles a function with XLA and falls back to a plain tf.function the
+first time the compilation fails, e.g. on TFP ops without an XLA kernel.
+xla_bench reports compile time and steps/second with and without XLA.
+"""
+
+import warnings
+from time import time
+import numpy as np
+import tensorflow as tf
+from . import config
+
+XLA_ERRORS = (tf.errors.InvalidArgumentError,tf.errors.UnimplementedError,tf.errors.InternalError)
+
+def jit(f): # XLA version of the Python function f, with fallback to tf.function(f)
+    compiled = tf.function(f,jit_compile=True)
+    plain = tf.function(f)
+    state = {'xla':True}
+    def call(*args, **kwargs):
+        if state['xla']:
+            try:
+                return compiled(*args,**kwargs)
+            except XLA_ERRORS as e:
+                state['xla'] = False
+                warnings.warn('%s does not compile with XLA, using tf.function: %s' % (f.__name__,str(e).splitlines()[0]))
+        return plain(*args,**kwargs)
+    call.__name__ = f.__name__
+    return call
+
+def train_step_compiles(model_,x): # Whether the ELBO training step of model_ compiles with XLA
+    x = tf.constant(x)
+    model_(x[:1])
+    rng_state = model_.rng.state.numpy()
+    @tf.function(jit_compile=True)
+    def step(x):
+        with tf.GradientTape() as tape:
+            loss = model_.MyELBO(x,model_(x))
+        return tape.gradient(loss,model_.trainable_variables)
+    try:
+        step(x)
+        return True
+    except XLA_ERRORS as e:
+        warnings.warn('The training step does not compile with XLA, training without it: %s' % str(e).splitlines()[0])
+        return False
+    finally:
+        model_.rng.reset(rng_state)
+
+def timed(f,reps): # Time of the first call (tracing and compilation) and mean time of the next reps calls
+    t0 = time()
+    f()
+    t_compile = time() - t0
+    t0 = time()
+    for _ in range(reps):
+        f()
+    return t_compile, (time() - t0)/reps
+
+def xla_bench(batch_sizes=(100,500,2000),reps=20): # Return one row per stage, batch size and mode
+    from .data import validation_set
+    from .forward import FP
+    from .network import MyBNN
+    from .posterior import station_summaries
+    from tensorflow.keras.optimizers import Adam
+    _, Y = validation_set()
+    n = config.n
+    rows = []
+    for b in batch_sizes:
+        x = tf.constant(np.asarray(Y[:b]))
+        x2 = tf.random.uniform((1,b,n),*config.prior_bounds)
+        for xla in [False,True]:
+            fp = tf.function(FP.python_function,jit_compile=xla)
+            stages = {'FP':lambda: fp(x[:,:n],x2).numpy()}
+            model_ = MyBNN(config.Mixture)
+            model_.compile(optimizer=Adam(learning_rate=config.l_r[0],epsilon=1e-16),loss=model_.MyELBO,jit_compile=xla)
+            stages['train_step'] = lambda: model_.train_on_batch(x,x)
+            summaries = tf.function(station_summaries,jit_compile=xla)
+            stages['inference'] = lambda: {k: v.numpy() for k, v in summaries(model_(x),100).items()}
+            for stage, f in stages.items():
+                try:
+                    t_compile, t_step = timed(f,reps)
+                    row = {'stage':stage,'batch':b,'xla':xla,'compile_s':t_compile,'steps_per_s':1/t_step}
+                except XLA_ERRORS as e:
+                    row = {'stage':stage,'batch':b,'xla':xla,'error':str(e).splitlines()[0]}
+                rows.append(row)
+                print(row)
+    return rows
@@ -0,0 +1,16 @@
+import numpy as np
+from mvae import config
+from mvae.data import generate_dataset, FP_np
+
+def test_generate_dataset_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(config,'cache_dir',str(tmp_path))
+    monkeypatch.setattr(config,'chunk_size',30)
+    monkeypatch.setattr(config,'n_workers',1)
+    X1, Y1 = generate_dataset(100,7,0.)
+    monkeypatch.setattr(config,'cache_dir',str(tmp_path/'pool'))
+    monkeypatch.setattr(config,'n_workers',2)
+    X2, Y2 = generate_dataset(100,7,0.)
+    np.testing.assert_array_equal(X1,X2)
+    np.testing.assert_array_equal(Y1,Y2)
+    n = config.n
+    np.testing.assert_allclose(Y1[:,n:],FP_np(X1[:,n:],X1[None,:,:n])[0],atol=1e-5)
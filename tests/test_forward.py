@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+tf = pytest.importorskip('tensorflow')
+from mvae import config
+from mvae.forward import FP, FP_unrolled, FP_adjoint, fp_solve
+
+def soundings(b,sampl_=1,seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.exp(rng.uniform(0.,1.,(b,config.n)))
+    x1 = (config.total_thick*t/t.sum(1,keepdims=True)).astype(np.float32)
+    x2 = rng.uniform(*config.prior_bounds,(sampl_,b,config.n)).astype(np.float32)
+    return tf.constant(x1), tf.constant(x2)
+
+@pytest.mark.parametrize('b',[7,600]) # 600 > fp_block: solved in blocks
+def test_FP_matches_unrolled(b):
+    x1, x2 = soundings(b)
+    np.testing.assert_allclose(FP(x1,x2).numpy(),FP_unrolled(x1,x2).numpy(),atol=1e-4)
+
+def test_FP_blocks_match_single_solve():
+    x1, x2 = soundings(3,sampl_=300)
+    assert 3*300 > config.fp_block
+    np.testing.assert_allclose(FP(x1,x2).numpy(),fp_solve(x1,x2).numpy(),atol=1e-5)
+
+def gradients(f,x1,x2,*args):
+    with tf.GradientTape() as tape:
+        tape.watch([x1,x2])
+        y = f(x1,x2,*args)
+        y = tf.reduce_sum(tf.random.stateless_normal(tf.shape(y),[1,2])*y)
+    return tape.gradient(y,[x1,x2])
+
+def rel_error(g,g_):
+    return (tf.norm(g - g_)/tf.norm(g)).numpy()
+
+@pytest.mark.parametrize('b,sampl_',[(64,1),(16,3)])
+def test_FP_adjoint_matches_autodiff(b,sampl_):
+    x1, x2 = soundings(b,sampl_)
+    for g, g_ in zip(gradients(FP,x1,x2),gradients(FP_adjoint,x1,x2)):
+        assert rel_error(g,g_) < 1e-3
+
+def test_FP_adjoint_frequency_subset():
+    x1, x2 = soundings(32,2)
+    idx = tf.constant([3,11,12,40,49])
+    w = tf.gather(tf.constant(config.omega),idx)
+    cols = tf.concat([idx,idx + config.m],0)
+    np.testing.assert_allclose(FP(x1,x2,w).numpy(),tf.gather(FP(x1,x2),cols,axis=-1).numpy(),atol=1e-5)
+    np.testing.assert_allclose(FP_adjoint(x1,x2,w).numpy(),FP(x1,x2,w).numpy(),atol=1e-6)
+    for g, g_ in zip(gradients(FP,x1,x2,w),gradients(FP_adjoint,x1,x2,w)):
+        assert rel_error(g,g_) < 1e-3
+
+def test_FP_adjoint_dynamic_frequency_subset():
+    # Subset of unknown size, as in the frequency-subsampled ELBO
+    x1, x2 = soundings(16,2)
+    w = tf.gather(tf.constant(config.omega),[0,7,30])
+    @tf.function(input_signature=[tf.TensorSpec([None],tf.float64)])
+    def grads(w):
+        return gradients(FP,x1,x2,w) + gradients(FP_adjoint,x1,x2,w)
+    g = grads(w)
+    for k in range(2):
+        assert rel_error(g[k],g[k+2]) < 1e-3
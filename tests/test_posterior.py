@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+tf = pytest.importorskip('tensorflow')
+tfp = pytest.importorskip('tensorflow_probability')
+from mvae import config
+from mvae.forward import FP
+from mvae.posterior import predictive_stats, mixture_dist, map_find
+
+def posterior(stations):
+    rng = np.random.default_rng(0)
+    t = np.exp(rng.uniform(0.,1.,(stations,config.n)))
+    xx = (config.total_thick*t/t.sum(1,keepdims=True)).astype(np.float32)
+    mu = rng.uniform(1.,3.,(stations,config.n)).astype(np.float32)
+    q = tfp.distributions.Independent(tfp.distributions.TruncatedNormal(mu,.2,.1,4.),reinterpreted_batch_ndims=1)
+    return xx, q
+
+def test_predictive_stats_blocks_and_chunks(monkeypatch):
+    monkeypatch.setattr(config,'pred_threads',2)
+    xx, q = posterior(5)
+    tf.random.set_seed(1)
+    y = FP(xx,q.sample(20000)).numpy()
+    ref = {'mean':y.mean(0),'std':y.std(0),'quantiles':np.quantile(y,config.pred_quantiles,0)}
+    # Blocks of 2 stations, 2000 soundings (1000 samples) per chunk
+    res = predictive_stats(xx,q,20000,chunk=2000,block=2)
+    assert res['quantiles'].shape==(len(config.pred_quantiles),5,2*config.m)
+    tol = .05*ref['std'] + 1e-3
+    assert np.all(np.abs(res['mean'] - ref['mean']) < tol)
+    assert np.all(np.abs(res['std'] - ref['std']) < tol)
+    assert np.all(np.abs(res['quantiles'] - ref['quantiles']) < 2*tol)
+    res = predictive_stats(xx,q,20000,chunk=2000,block=2,histogram=False)
+    assert sorted(res)==['mean','std']
+
+def random_mixture(stations, mixture, d, seed):
+    # Locations beyond [.1,4] put modes on the truncation bounds
+    rng = np.random.default_rng(seed)
+    pro = rng.dirichlet(np.ones(mixture),stations).astype(np.float32)
+    sig = rng.uniform(.05,1.,(stations,mixture,d)).astype(np.float32)
+    loc = rng.uniform(-.5,4.5,(stations,mixture,d)).astype(np.float32)
+    return pro, sig, loc
+
+def test_map_find_beats_samples():
+    pro, sig, loc = random_mixture(64,3,config.n,0)
+    q = mixture_dist(pro,sig,loc)
+    best = tf.reduce_max(q.log_prob(q.sample(20000,seed=[1,2])),0).numpy()
+    assert np.all(q.log_prob(map_find(pro,sig,loc)).numpy() >= best - 1e-4)
+
+def test_map_find_matches_a_grid():
+    pro, sig, loc = random_mixture(64,3,1,1)
+    q = mixture_dist(pro,sig,loc)
+    grid = np.linspace(.1,4.,40001,dtype=np.float32)[:,None,None]
+    best = tf.reduce_max(q.log_prob(np.broadcast_to(grid,(grid.shape[0],64,1))),0).numpy()
+    x = map_find(pro,sig,loc).numpy()
+    assert np.any(x==np.float32(.1)) and np.any(x==np.float32(4.)) # Modes on both bounds
+    np.testing.assert_allclose(q.log_prob(x).numpy(),best,atol=1e-4)
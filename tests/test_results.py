@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from mvae import results
+from mvae.results import save_results, load_results, find_results, ResultsWriter
+
+@pytest.fixture(params=['h5','npy'])
+def backend(request, monkeypatch):
+    if request.param=='h5':
+        pytest.importorskip('h5py')
+    else:
+        monkeypatch.setattr(results,'h5py',None)
+    return request.param
+
+def test_store_roundtrip(tmp_path, backend):
+    res = {'samples':np.random.rand(100,5),'loss_tr':[3.,2.,1.],'prob':np.ones((1,5))}
+    path = save_results(str(tmp_path/'results_1d'),res)
+    assert find_results(str(tmp_path/'results_1d'))==path
+    with load_results(path) as store:
+        assert sorted(store.keys())==sorted(res)
+        np.testing.assert_allclose(store['samples'][10:20],res['samples'][10:20].astype(np.float32))
+        np.testing.assert_allclose(store['loss_tr'][()],res['loss_tr'])
+
+def test_h5_without_h5py(tmp_path, monkeypatch):
+    monkeypatch.setattr(results,'h5py',None)
+    with pytest.raises(ImportError):
+        load_results(str(tmp_path/'results_1d.h5'))
+
+def test_writer_chunks(tmp_path, backend):
+    x = np.random.rand(10,3,5)
+    with ResultsWriter(str(tmp_path/'results_1d'),len(x)) as writer:
+        for a in range(0,len(x),4):
+            writer.write(a,{'samples':x[a:a+4],'mean':x[a:a+4,0]})
+    with load_results(writer.path) as store:
+        np.testing.assert_allclose(store['samples'][()],x.astype(np.float32))
+        np.testing.assert_allclose(store['mean'][2:7],x[2:7,0].astype(np.float32))
@@ -0,0 +1,45 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import numpy as np
+import pytest
+tf = pytest.importorskip('tensorflow')
+from mvae import config
+from mvae.network import MyBNN, build_net
+from mvae.posterior import map_find
+from mvae.server import MicroBatcher, bucket, make_handler
+
+def test_bucket():
+    assert [bucket(k,16) for k in [0,1,2,3,8,9,16,40]]==[1,1,2,4,8,16,16,16]
+
+def test_batches_reuse_traces(monkeypatch):
+    monkeypatch.setattr(config,'xla',False)
+    monkeypatch.setattr(config,'server_max_samples',8)
+    model = MyBNN(2,net=build_net([16,16],2))
+    batcher = MicroBatcher(model,max_batch=16,max_delay=0)
+    x = np.random.default_rng(0).uniform(0.,1.,(40,config.inp+config.n)).astype(np.float32)
+    res = batcher.submit(x[:5],3)
+    traced = map_find.experimental_get_tracing_count()
+    for k, samples in [(6,4),(7,3),(8,4)]: # Same bucket of 8 stations and 4 samples
+        res = batcher.submit(x[:k],samples)
+        assert res['mean'].shape==(k,config.n) and res['samples'].shape==(k,samples,config.n)
+    assert map_find.experimental_get_tracing_count()==traced
+    res = batcher.submit(x,100) # Padded to 3 chunks of 16, samples clamped
+    assert res['map'].shape==(40,config.n) and res['samples'].shape==(40,8,config.n)
+    np.testing.assert_allclose(res['map'][:5],batcher.submit(x[:5])['map'],rtol=1e-5,atol=1e-6)
+
+def test_batch_error_is_a_500():
+    def model(x):
+        raise RuntimeError('model failure')
+    server = ThreadingHTTPServer(('127.0.0.1',0),make_handler(MicroBatcher(model,max_delay=0)))
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    try:
+        body = json.dumps({'soundings':[0.]*(config.n+2*config.m)}).encode()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen('http://127.0.0.1:%d/infer' % server.server_port,body,timeout=60)
+        assert e.value.code==500 and 'model failure' in json.loads(e.value.read())['error']
+    finally:
+        server.shutdown()
+        server.server_close()
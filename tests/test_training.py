@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+tf = pytest.importorskip('tensorflow')
+from mvae import config
+from mvae.data import training_set, validation_set
+from mvae.network import build_net
+from mvae.training import train_trial, load_model
+
+@pytest.fixture
+def small(tmp_path, monkeypatch):
+    for k, v in {'cache_dir':str(tmp_path/'data'),'samples':600,'samples_val':200,'n_workers':1,
+                 'nodes_NN':[16,16],'Mixture':2,'patience':None,'ckpt_every':10}.items():
+        monkeypatch.setattr(config,k,v)
+    return training_set()[1], validation_set()[1]
+
+def test_resume_matches_uninterrupted_run(tmp_path, small):
+    Y, Y_val = small
+    net_a, net_b = build_net(config.nodes_NN,config.Mixture), build_net(config.nodes_NN,config.Mixture)
+    net_b.set_weights(net_a.get_weights()) # Same initial weights
+    model_a, history_a = train_trial(str(tmp_path/'a'),1e-3,200,4,Y,Y_val,net_a,resume_=False)
+    train_trial(str(tmp_path/'b'),1e-3,200,2,Y,Y_val,net_b,resume_=False)
+    model_b, history_b = train_trial(str(tmp_path/'b'),1e-3,200,4,Y,Y_val,resume_=True)
+    np.testing.assert_allclose(history_b['val_loss'],history_a['val_loss'],rtol=1e-5)
+    for w_a, w_b in zip(model_a.get_weights(),model_b.get_weights()):
+        np.testing.assert_allclose(w_b,w_a,rtol=1e-5,atol=1e-7)
+
+def test_load_model_and_resume_check(tmp_path, small, monkeypatch):
+    Y, Y_val = small
+    path = str(tmp_path/'t')
+    model, _ = train_trial(path,1e-3,200,1,Y,Y_val,build_net([16,8],3),resume_=False)
+    monkeypatch.setattr(config,'Mixture',2) # The network comes from the checkpoint, not the config
+    loaded, history = load_model(path)
+    assert len(history['loss'])==1
+    for w, w_ in zip(model.get_weights(),loaded.get_weights()):
+        np.testing.assert_array_equal(w_,w)
+    with pytest.raises(ValueError): # Other settings are not resumed
+        train_trial(path,1e-4,200,2,Y,Y_val,build_net([16,8],3),resume_=True)
+
+def test_freq_annealing_at_the_horizon(tmp_path, small, monkeypatch):
+    Y, Y_val = small
+    monkeypatch.setattr(config,'freq_subset',10)
+    monkeypatch.setattr(config,'freq_anneal',2)
+    path = str(tmp_path/'t')
+    _, history = train_trial(path,1e-3,200,2,Y,Y_val,resume_=False,horizon=4) # First rung of a sweep
+    assert history['n_freq']==[10,10]
+    _, history = train_trial(path,1e-3,200,4,Y,Y_val,resume_=True,horizon=4)
+    assert history['n_freq']==[10,10,30,config.m]
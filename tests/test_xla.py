@@ -0,0 +1,13 @@
+import pytest
+tf = pytest.importorskip('tensorflow')
+from mvae import config
+from mvae.data import validation_set
+from mvae.network import MyBNN, build_net
+from mvae.xla import train_step_compiles
+
+@pytest.mark.parametrize('fp_adjoint',[False,True])
+def test_train_step_compiles(tmp_path, monkeypatch, fp_adjoint):
+    for k, v in {'cache_dir':str(tmp_path),'samples_val':200,'n_workers':1,'fp_adjoint':fp_adjoint}.items():
+        monkeypatch.setattr(config,k,v)
+    _, Y = validation_set()
+    assert train_step_compiles(MyBNN(2,net=build_net([16,16],2)),Y[:64])